@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+import tract_buffers
+
+METRES_PER_MILE = 1609.344
+
+def build_index(tract_geoids, tract_xy, uni_ids, uni_xy, k=10):
+    """Distances from every tract to its k nearest universities, in one sweep.
+
+    Coordinates are projected (metres), e.g. EPSG:2163. Rows of `distances`
+    and `universities` are sorted nearest first; universities holds row
+    numbers into uni_ids. Missing neighbors (fewer than k universities)
+    have distance inf. The coordinates are kept too, for the buffer test
+    in accessible_universities.
+    """
+    k = min(k, len(uni_ids))
+    distances, nearest = cKDTree(np.asarray(uni_xy, dtype=float)).query(np.asarray(tract_xy, dtype=float), k=k)
+    return {
+        'geoids': np.asarray(tract_geoids).astype(str),
+        'uni_ids': np.asarray(uni_ids).astype(str),
+        'distances': distances.reshape(len(tract_xy), k),
+        'universities': nearest.reshape(len(tract_xy), k).astype(np.int32),
+        'tract_xy': np.asarray(tract_xy, dtype=float),
+        'uni_xy': np.asarray(uni_xy, dtype=float),
+    }
+
+def save_index(index, filename):
+    np.savez(filename, **index)
+
+def load_index(filename):
+    with np.load(filename) as f:
+        return {name: f[name] for name in f.files}
+
+def accessible_universities(index, miles):
+    """Number of universities within `miles` of each tract.
+
+    A university counts if it lies inside the tract's buffer polygon, the
+    test education_deserts.csv is built with (see
+    tract_buffers.buffer_members), so only the few tracts with a
+    university in the thin band between the polygon and the circle need
+    the polygon itself. Counts come from the k nearest only, so they
+    saturate at k; whether a tract is a desert (count 0) is exact for any
+    radius.
+    """
+    radius = miles * METRES_PER_MILE
+    distances = index['distances']
+    inside = distances < radius * tract_buffers.INRADIUS
+    for i in np.flatnonzero(((distances >= radius * tract_buffers.INRADIUS) & (distances <= radius)).any(axis=1)):
+        nearest = np.flatnonzero(distances[i] <= radius)
+        inside[i] = False
+        inside[i, tract_buffers.buffer_members(index['tract_xy'][i], nearest, index['uni_xy'][index['universities'][i, nearest]], radius)] = True
+    counts = inside.sum(axis=1)
+    return pd.Series(counts, index=index['geoids'], name='Number of Accessible Universities')
+
+def education_deserts(index, miles):
+    """Same layout as datasets/education_deserts.csv, for any radius."""
+    education_deserts = accessible_universities(index, miles).to_frame()
+    education_deserts['Education Desert'] = (education_deserts['Number of Accessible Universities'] == 0).astype(int)
+    return education_deserts
@@ -0,0 +1,56 @@
+"""Checks that top_k_sharded writes exactly top_k_locations' text output.
+
+    python benchmarks/check_sharded.py --tracts 3000 --radius 20000 --k 30 150
+
+Runs both on a synthetic data set (see generate.py; a smaller radius
+splits it into more components) for every metric and k, and exits with
+status 1 if any output differs.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import generate
+import optimizer
+
+METRICS = ['compute_added_average_salary', 'compute_added_total_salary', 'compute_num_added_grads', 'compute_total_pop', 'compute_num_census_tracts']
+
+def outputs(files, k, metric, processes=None):
+    # Text output of top_k_locations and of top_k_sharded
+    compute_weight = getattr(optimizer, metric)
+    texts = []
+    with contextlib.redirect_stdout(io.StringIO()), tempfile.TemporaryDirectory() as picks_dir:
+        optimizer.top_k_locations(files['graph'], files['predictions'], files['census'], k, compute_weight, compact=True, results_file=os.path.join(picks_dir, 'locations.csv'))
+        with open(os.path.join(picks_dir, 'locations.txt')) as f:
+            texts.append(f.read())
+        optimizer.top_k_sharded(files['graph'], files['predictions'], files['census'], k, compute_weight, processes, results_file=os.path.join(picks_dir, 'sharded.csv'))
+        with open(os.path.join(picks_dir, 'sharded.txt')) as f:
+            texts.append(f.read())
+    return texts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracts', type=int, default=3000)
+    parser.add_argument('--radius', type=float, default=20000.0)
+    parser.add_argument('--k', type=int, nargs='+', default=[30, 150])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    out_dir = os.path.join(generate.DATA_PATH, 'check-' + str(args.tracts) + '-' + str(int(args.radius)) + '-' + str(args.seed))
+    if os.path.isfile(os.path.join(out_dir, 'meta.json')):
+        files = {name: os.path.join(out_dir, filename) for name, filename in [('graph', 'tracts_in_buffer.json'), ('census', 'census_tract_feats.csv'), ('predictions', 'predictions.csv')]}
+    else:
+        files = generate.generate(args.tracts, out_dir, args.seed, args.radius)
+    failed = False
+    for k in args.k:
+        for metric in METRICS:
+            locations, sharded = outputs(files, k, metric, args.processes)
+            same = locations == sharded
+            failed = failed or not same
+            print(metric + ' k=' + str(k) + ': ' + ('same' if same else 'DIFFERENT'))
+    sys.exit(1 if failed else 0)
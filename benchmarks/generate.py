@@ -0,0 +1,126 @@
+"""Synthetic stand-ins for tracts_in_buffer.json and the optimizer's CSVs.
+
+    python benchmarks/generate.py 73k
+
+writes benchmarks/data/73k/{tracts_in_buffer.json, census_tract_feats.csv,
+predictions.csv, points.npz}. Tracts are points in an EPSG:2163-sized
+box, mostly in metro clusters of very different sizes plus a thinly
+spread rural remainder, linked like the real graph to every tract within
+radius (25 miles). The same scale and seed always give the same files.
+With --no-graph the neighbor graph, which only top_k_spatial can do
+without, is skipped.
+"""
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from network_reader import FEATURE_COLUMNS, TOTAL_POP, MEDIAN_INCOME, HOUSEHOLDS, LABOR_FORCE, DEGREE_PCTS
+
+# Tract counts: 10k for quick runs, roughly the number of census tracts
+# (73k) and of block groups (220k)
+SCALES = {'10k': 10000, '73k': 73000, '220k': 220000}
+
+RADIUS = 40233.6 # 25 miles in metres
+EXTENT = (4.5e6, 2.8e6) # roughly the lower 48 in EPSG:2163 metres
+URBAN_SHARE = 0.8
+TRACTS_PER_METRO = 250
+METRO_SPREAD = 15000.0 # metres, for a metro of TRACTS_PER_METRO tracts
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+def tract_points(n, rng):
+    # Metro sizes are heavy tailed; a metro's spread grows with the
+    # square root of its size so density stays roughly constant
+    num_metros = max(1, n // TRACTS_PER_METRO)
+    centers = rng.uniform((0, 0), EXTENT, size=(num_metros, 2))
+    sizes = rng.pareto(1.2, num_metros) + 1
+    urban = int(n * URBAN_SHARE)
+    counts = rng.multinomial(urban, sizes / sizes.sum())
+    spread = METRO_SPREAD * np.sqrt(counts / TRACTS_PER_METRO)
+    metro = np.repeat(np.arange(num_metros), counts)
+    points = centers[metro] + rng.normal(size=(urban, 2)) * spread[metro, None]
+    rural = rng.uniform((0, 0), EXTENT, size=(n - urban, 2))
+    states = np.concatenate([metro % 56, rng.integers(0, 56, n - urban)])
+    return np.concatenate([points, rural]), states
+
+def geo_ids(states):
+    # 2-digit state, 3-digit county, 6-digit tract, like real geoIDs
+    serial = np.arange(len(states))
+    return ['%02d%03d%06d' % (state + 1, i % 997, i) for i, state in zip(serial, states)]
+
+def write_graph(filename, ids, points, radius, chunksize=5000):
+    # Streamed one chunk of tracts at a time, so the neighbor lists of the
+    # larger scales never all sit in memory
+    tree = cKDTree(points)
+    edges = 0
+    with open(filename, 'w') as f:
+        f.write('{')
+        for start in range(0, len(ids), chunksize):
+            found = tree.query_ball_point(points[start:start+chunksize], radius, return_sorted=True)
+            for i, neighbors in enumerate(found, start):
+                neighbors = [ids[j] for j in neighbors if j != i]
+                edges += len(neighbors)
+                f.write((', ' if i > 0 else '') + json.dumps(ids[i]) + ': ' + json.dumps(neighbors))
+        f.write('}')
+    return edges
+
+def features(ids, rng):
+    n = len(ids)
+    df = pd.DataFrame({'geoID': ids})
+    df[TOTAL_POP] = rng.integers(500, 9000, n)
+    df[MEDIAN_INCOME] = np.round(rng.lognormal(np.log(55000), 0.45, n))
+    df[HOUSEHOLDS] = (df[TOTAL_POP] / rng.uniform(2.2, 3.2, n)).round().astype(int)
+    df[LABOR_FORCE] = (df[TOTAL_POP] * rng.uniform(0.4, 0.7, n)).round().astype(int)
+    shares = rng.dirichlet((6, 3, 1, 0.6), n) * rng.beta(2, 5, n)[:, None]
+    for column, share in zip(DEGREE_PCTS, shares.T):
+        df[column] = share
+    return df[['geoID'] + FEATURE_COLUMNS]
+
+def predictions(feats, rng, share=0.25):
+    # Like the regression notebook, predictions only for some tracts
+    # (its education deserts) and clipped to [0, 1]
+    rows = np.sort(rng.choice(len(feats), int(len(feats) * share), replace=False))
+    pct = feats[DEGREE_PCTS].values[rows].sum(axis=1)
+    pred = np.clip(pct + rng.normal(0.03, 0.08, len(rows)), 0, 1)
+    return pd.DataFrame({'geoID': feats['geoID'].values[rows], 'pred_pct_bachelors': pred})
+
+def generate(n, out_dir, seed=0, radius=RADIUS, graph=True):
+    """Writes a synthetic data set of n tracts to out_dir, returning its file paths."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    points, states = tract_points(n, rng)
+    ids = geo_ids(states)
+    files = {
+        'graph': os.path.join(out_dir, 'tracts_in_buffer.json'),
+        'census': os.path.join(out_dir, 'census_tract_feats.csv'),
+        'predictions': os.path.join(out_dir, 'predictions.csv'),
+        'points': os.path.join(out_dir, 'points.npz'),
+    }
+    # Laid out like reproject.cached_projection's cache, for top_k_spatial
+    np.savez(files['points'], ids=np.array(ids), x=points[:, 0], y=points[:, 1])
+    edges = write_graph(files['graph'], ids, points, radius) if graph else None
+    feats = features(ids, rng)
+    feats.to_csv(files['census'], index=False)
+    predictions(feats, rng).to_csv(files['predictions'], index=False)
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump({'tracts': n, 'seed': seed, 'radius': radius, 'edges': edges}, f)
+    print('Wrote ' + str(n) + ' tracts' + (', ' + str(edges) + ' neighbor links (' + str(edges / n) + ' per tract)' if graph else '') + ' to ' + out_dir)
+    return files
+
+def data_dir(scale, seed=0):
+    return os.path.join(DATA_PATH, scale + ('' if seed == 0 else '-' + str(seed)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scales', nargs='+', choices=sorted(SCALES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--radius', type=float, default=RADIUS)
+    parser.add_argument('--no-graph', dest='graph', action='store_false')
+    args = parser.parse_args()
+    for scale in args.scales:
+        generate(SCALES[scale], data_dir(scale, args.seed), args.seed, args.radius, args.graph)
@@ -0,0 +1,123 @@
+"""Times the optimizer on the synthetic data sets from generate.py.
+
+    python benchmarks/run.py 10k 73k --k 100 --modes object compact_cold compact_warm spatial
+
+Each (scale, mode) case runs in a fresh process so its peak memory is
+its own. The case's profiling report (see profiling.py: spans for CSV
+parsing, JSON load, graph build or cache load, initial sort and every
+pick, plus counters) is appended as one JSON line to results.jsonl,
+together with the data set, the git commit and the peak RSS, so runs can
+be compared across commits and machines.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import generate
+import optimizer
+import profiling
+from graph_cache import default_cache_dir
+from network_reader import read_network, read_weights
+from spatial_greedy import SpatialGreedy, read_points
+
+# object: the original Network built from JSON; compact_cold: CSRNetwork
+# including the one-off binary cache build; compact_warm: CSRNetwork
+# from an existing cache; spatial: SpatialGreedy from the points alone
+MODES = ['object', 'compact_cold', 'compact_warm', 'spatial']
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.jsonl')
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_case(files, mode, k, metric):
+    # Runs in its own process; see run
+    cache_dir = default_cache_dir(files['graph'])
+    if mode == 'compact_cold' and os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+    compute_weight = getattr(optimizer, metric)
+    recorder = profiling.enable()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'spatial':
+            # Index and initial gains stand in for the graph and sort
+            with profiling.span('read_network'):
+                weights = read_weights(files['predictions'], files['census'], compute_weight)
+                geo_ids, xy = read_points(files['points'])
+            with profiling.span('initial_sort'):
+                network = SpatialGreedy(geo_ids, xy, [weights.get(geo_id, 0.0) for geo_id in geo_ids], generate.RADIUS)
+            with profiling.span('greedy'):
+                for i in range(k):
+                    with profiling.span('pick'):
+                        network.take()
+        else:
+            with profiling.span('read_network'):
+                network = read_network(files['graph'], files['predictions'], files['census'], compute_weight, mode != 'object')
+            with profiling.span('initial_sort'):
+                network.initial_sort()
+            with profiling.span('greedy'):
+                optimizer.greedy(network, k)
+    profiling.disable()
+    report = recorder.report()
+    # ru_maxrss is in kilobytes on Linux
+    report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return report
+
+def run(scale, mode, k, metric='compute_added_average_salary', seed=0):
+    """Benchmarks one case, generating its data set first if needed."""
+    out_dir = generate.data_dir(scale, seed)
+    files = {
+        'graph': os.path.join(out_dir, 'tracts_in_buffer.json'),
+        'census': os.path.join(out_dir, 'census_tract_feats.csv'),
+        'predictions': os.path.join(out_dir, 'predictions.csv'),
+        'points': os.path.join(out_dir, 'points.npz'),
+    }
+    needed = [files['points']] if mode == 'spatial' else [files['graph']]
+    if not all(os.path.isfile(filename) for filename in needed + [os.path.join(out_dir, 'meta.json')]):
+        generate.generate(generate.SCALES[scale], out_dir, seed, graph=mode != 'spatial')
+    if mode == 'compact_warm':
+        # Make sure the cache exists, outside the measured process
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            pool.apply(run_case, (files, 'compact_warm', 1, metric))
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        report = pool.apply(run_case, (files, mode, k, metric))
+    with open(os.path.join(out_dir, 'meta.json')) as f:
+        dataset = json.load(f)
+    dataset['scale'] = scale
+    return dict({'time': time.time(), 'commit': git_commit(), 'python': platform.python_version(),
+                 'machine': platform.node(), 'dataset': dataset, 'mode': mode, 'k': k, 'metric': metric}, **report)
+
+def summary(result):
+    spans = result['spans']
+    return '{} {} k={}: read {:.2f}s, sort {:.2f}s, pick mean {:.4f}s max {:.4f}s, peak {:.0f} MB'.format(
+        result['dataset']['scale'], result['mode'], result['k'], spans['read_network']['total'],
+        spans['initial_sort']['total'], spans['pick']['mean'], spans['pick']['max'], result['peak_rss_mb'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scales', nargs='+', choices=sorted(generate.SCALES))
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--k', type=int, default=100)
+    parser.add_argument('--metric', default='compute_added_average_salary')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=RESULTS_FILE)
+    args = parser.parse_args()
+    for scale in args.scales:
+        for mode in args.modes:
+            result = run(scale, mode, args.k, args.metric, args.seed)
+            print(summary(result))
+            with open(args.output, 'a') as f:
+                f.write(json.dumps(result) + '\n')
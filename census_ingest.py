@@ -0,0 +1,132 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+# Census features the regression notebook trains on (see college-grads-regression.ipynb)
+TRAIN_FEATURES = [
+    'geoID',
+
+    # demographics
+    'Total Population:',
+    'Population Density (Per Sq. Mile)',
+    'Pct. Male', 'Pct. White Alone', 'Pct. Black or African American Alone', 'Pct. American Indian and Alaska Native Alone', 'Pct. Asian Alone', 'Pct. Native Hawaiian and Other Pacific Islander Alone', 'Pct. Some Other Race Alone', 'Pct. Two or More Races',
+    'Pct. Under 5 Years', 'Pct. 5 to 9 Years', 'Pct. 10 to 14 Years', 'Pct. 15 to 17 Years', 'Pct. 18 to 24 Years', 'Pct. 25 to 34 Years', 'Pct. 35 to 44 Years', 'Pct. 45 to 54 Years', 'Pct. 55 to 64 Years', 'Pct. 65 to 74 Years', 'Pct. 75 to 84 Years', 'Pct. 85 Years and Over',
+
+    # education - omit post-college features (leakage)
+    'Pct. Students enrolled in private school',
+
+    # employment
+    'Pct. Pop 16+ not in labor force',
+    'Pct. Pop 16+ in armed forces',
+    'Pct. Pop 16+ unemployed',
+
+    # household income
+    'Median Gross Rent',
+    'Median Household Income (In 2017 Inflation Adjusted Dollars)',
+    'Pct. Households: Less than $10,000', 'Pct. Households: $10,000 to $14,999', 'Pct. Households: $15,000 to $19,999', 'Pct. Households: $20,000 to $24,999', 'Pct. Households: $25,000 to $29,999', 'Pct. Households: $30,000 to $34,999', 'Pct. Households: $35,000 to $39,999', 'Pct. Households: $40,000 to $44,999', 'Pct. Households: $45,000 to $49,999', 'Pct. Households: $50,000 to $59,999', 'Pct. Households: $60,000 to $74,999', 'Pct. Households: $75,000 to $99,999', 'Pct. Households: $100,000 to $124,999', 'Pct. Households: $125,000 to $149,999', 'Pct. Households: $150,000 to $199,999', 'Pct. Households: $200,000 or More',
+
+    # poverty
+    'Pct. Families below poverty level', 'Pct. Population for Whom Poverty Status Is Determined: Under 1.00 (Doing Poorly)', 'Pct. Population for Whom Poverty Status Is Determined: 1.00 to 1.99 (Struggling)', 'Pct. Population for Whom Poverty Status Is Determined: Under 2.00 (Poor or Struggling)',
+
+    # education desert
+    'Education Desert'
+]
+
+# Label features (summed into pct. bachelor's and up)
+LABEL_FEATURES = [
+    "Pct. Population 25 Years and Over: Bachelor's Degree",
+    "Pct. Population 25 Years and Over: Master's Degree",
+    'Pct. Population 25 Years and Over: Professional School Degree',
+    'Pct. Population 25 Years and Over: Doctorate Degree'
+]
+
+def downcast(column):
+    # Only downcast when no value changes, so cached data reads back exactly
+    if column.dtype.kind == 'i':
+        return pd.to_numeric(column, downcast='integer')
+    if column.dtype.kind == 'f':
+        small = column.astype(np.float32)
+        if np.array_equal(small.values.astype(np.float64), column.values, equal_nan=True):
+            return small
+    return column
+
+def default_cache_path(csv_path, columns):
+    return csv_path + '.' + hashlib.sha1('\n'.join(columns).encode()).hexdigest()[:10] + '.npz'
+
+def numeric(column):
+    # Census CSVs with a description row parse every column as text
+    try:
+        return pd.to_numeric(column)
+    except (ValueError, TypeError):
+        # Text in some chunks and numbers in others is all text
+        return column.where(column.isna(), column.astype(str)) if column.dtype == object else column
+
+def save_cache(df, csv_path, cache_path):
+    # Numeric columns are stored as is; others as strings plus a mask of
+    # missing values, with each column's dtype to restore on load
+    stat = os.stat(csv_path)
+    arrays = {}
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if values.dtype.kind in 'biuf':
+            arrays['c' + str(i)] = values.values
+        else:
+            missing = values.isna().values
+            arrays['c' + str(i)] = np.asarray(values.astype(object).where(~missing, '').astype(str), dtype=str)
+            arrays['m' + str(i)] = missing
+    dtypes = np.array([str(dtype) for dtype in df.dtypes], dtype=str)
+    np.savez(cache_path, columns=np.array(df.columns, dtype=str), dtypes=dtypes, source=np.array([stat.st_mtime_ns, stat.st_size]), **arrays)
+
+def load_cache(csv_path, columns, cache_path):
+    # Returns None if the cache is missing, stale or holds other columns
+    if not os.path.isfile(cache_path):
+        return None
+    stat = os.stat(csv_path)
+    with np.load(cache_path) as cache:
+        if 'dtypes' not in cache or cache['source'].tolist() != [stat.st_mtime_ns, stat.st_size] or cache['columns'].tolist() != list(columns):
+            return None
+        data = {}
+        for i, (column, dtype) in enumerate(zip(columns, cache['dtypes'].tolist())):
+            values = cache['c' + str(i)]
+            if 'm' + str(i) in cache:
+                values = values.astype(object)
+                values[cache['m' + str(i)]] = np.nan
+                values = pd.Series(values).astype(dtype)
+            data[column] = values
+        return pd.DataFrame(data, columns=list(columns))
+
+def ingest(csv_path, columns, cache_path, chunksize=20000, **read_csv_kwargs):
+    """Streams the selected columns of a (very wide) census CSV into a compact cache.
+
+    The file is read chunksize rows at a time, keeping only `columns`.
+    Columns not given a dtype are parsed as numbers where they all are,
+    then downcast where that loses nothing. The result is saved as one
+    array per column in cache_path (.npz), checked to read back exactly,
+    and returned. Pass skiprows=[1] for the ACS files' description row.
+    """
+    read_csv_kwargs.setdefault('float_precision', 'round_trip')
+    typed = read_csv_kwargs.get('dtype', {})
+    typed = typed if isinstance(typed, dict) else columns
+    untyped = [column for column in columns if column not in typed]
+    chunks = []
+    for chunk in pd.read_csv(csv_path, usecols=columns, chunksize=chunksize, **read_csv_kwargs):
+        chunk = chunk[columns]
+        chunk[untyped] = chunk[untyped].apply(numeric)
+        chunks.append(chunk)
+    df = pd.concat(chunks, ignore_index=True)
+    df[untyped] = df[untyped].apply(numeric).apply(downcast)
+    save_cache(df, csv_path, cache_path)
+    cached = load_cache(csv_path, columns, cache_path)
+    if cached is None or not cached.equals(df):
+        os.remove(cache_path)
+        raise ValueError('Cache of ' + csv_path + ' does not read back exactly')
+    return df
+
+def read_cached(csv_path, columns, cache_path=None, **read_csv_kwargs):
+    """Selected columns of csv_path, from the cache when it is up to date."""
+    cache_path = cache_path or default_cache_path(csv_path, columns)
+    df = load_cache(csv_path, columns, cache_path)
+    if df is None:
+        df = ingest(csv_path, columns, cache_path, **read_csv_kwargs)
+    return df
@@ -1,9 +1,4 @@
 # Library Imports
-import fiona 
-import rtree
-import shapely
-from shapely.geometry import shape
-import geopandas as gpd
 import pandas as pd
 import numpy as np
 import subprocess
@@ -11,20 +6,26 @@ import os
 import requests
 from bs4 import BeautifulSoup
 
-# Shapely library to help with calculation
-# of the representative centroid position
-from shapely.geometry import MultiPoint
-
-# default dictionary (a dictionary with a default value if a key doesn't exist)
-from collections import defaultdict
-
 # To unzip file
 import zipfile
 
-# To have progress bar
-from tqdm import tqdm
 import json
 
+# Parallel buffer radius queries
+import tract_buffers
+
+# Nearest-university distances for any desert radius
+import accessibility
+
+# Chunked, column-selective census CSV ingestion
+import census_ingest
+
+# Parallel census tract shapefile parsing
+import tract_shapes
+
+# Bulk, cached EPSG:4269 -> EPSG:2163 projection
+import reproject
+
 # Helper function to create a new folder
 def mkdir(path):
     try: 
@@ -42,6 +43,11 @@ if __name__ == '__main__':
     print('Initializing constants...')
     # Buffer radius
     BUFFER = 40233.6 # 25 miles in metres
+
+    # Radii (in miles) to derive education deserts for from the
+    # accessibility index, and how many nearest universities it keeps
+    DESERT_RADII = [25, 50, 60]
+    NEAREST_UNIVERSITIES = 10
     
     # Census tracts shapefiles url
     ct_shape_url = 'https://www.census.gov/geo/maps-data/data/cbf/cbf_tracts.html'
@@ -54,6 +60,16 @@ if __name__ == '__main__':
     au_file_name = 'IPEDS_data.xlsx'
     au_data_url = 'https://public.tableau.com/s/sites/default/files/media/Resources/' + au_file_name
 
+    # Census tract features to keep, by column position (not counting the
+    # FIPS index column), as selected in data-exploration.ipynb
+    CENSUS_FEATURES = [
+        46,                                                                                           # Locational
+        61, 56, 62, 278, 279, 280, 281, 282, 283, 284, 153, 154, 155, 156, 157, 158, 159, 160, 161, 162, 163, 164, # Demographics
+        614, 606, 548, 549, 550, 551, 552, 553, 554, 547,                                             # Education
+        634, 628, 630, 633, 629,                                                                      # Employment
+        763, 764, 765, 766, 767, 768, 769, 770, 771, 772, 773, 774, 775, 776, 777, 778, 762, 880, 1233, 1383, 1382, 1410, 1411, 1412, 1409 # Income
+    ]
+
     # Directory of datasets
     DATASETS_PATH = 'datasets/'
 
@@ -78,8 +94,12 @@ if __name__ == '__main__':
         # Remove the old census tract .zip shapefile
         subprocess.call(['rm', '-rf', DATASETS_PATH + ct_file_name + '.zip'])
         
-    # Store data in census_tracts
-    census_tracts = pd.read_csv(DATASETS_PATH + ct_file_name, encoding='ISO-8859-1', low_memory=False)
+    # Store data in census_tracts, streaming just the selected columns
+    # out of the 2000+ into a compact columnar cache (see census_ingest.py),
+    # skipping the row of column descriptions under the header
+    census_header = pd.read_csv(DATASETS_PATH + ct_file_name, encoding='ISO-8859-1', nrows=0).columns.drop('FIPS')
+    census_columns = ['FIPS'] + list(census_header[CENSUS_FEATURES])
+    census_tracts = census_ingest.read_cached(DATASETS_PATH + ct_file_name, census_columns, encoding='ISO-8859-1', dtype={'FIPS': str}, skiprows=[1]).set_index('FIPS')
     
     ################################ UNIVERSITY DATA ################################  
     print('Downloading university data...')
@@ -88,34 +108,18 @@ if __name__ == '__main__':
 
         os.system('!wget --directory-prefix={} -Nq {}'.format(DATASETS_PATH, au_data_url))
     
-    # Store data in universities
-    universities = pd.read_excel(DATASETS_PATH + au_file_name, index_col='ID number')
-
-    # List of tuples to store all the university
-    # locations as Shapely Points
-    uni_list = []
-
-    for idx, id_num in enumerate(universities.index):
-        uni_list.append((id_num, shape({"type": "Point",
-                                        "coordinates": (universities.loc[id_num, 'Longitude location of institution'],
-                                                        universities.loc[id_num, 'Latitude location of institution'])})))
-    
-    # Setting our coordinate system for the tracts 
-    # and universities to EPSG:2163 https://epsg.io/2163
-    uni_gdf = gpd.GeoDataFrame(geometry=[uni_pt for uniid, uni_pt in uni_list], index=[uniid for uniid, uni_pt in uni_list])
-    uni_gdf.crs = {'init': 'epsg:4269'}
-    uni_gdf.to_crs({'init': 'epsg:2163'}, inplace=True);
-    
-    # ----------------------------
-    # Initialize rtree spatial index
-    # with just its centroid
-    uni_index = rtree.index.Index()
-
-    # Iterate over all american universities
-    for idx, (id_num, uni) in tqdm(enumerate(uni_gdf.iterrows())):
-
-        # add coordinates of univeristy location and store id along with it
-        uni_index.insert(idx, coordinates=uni.geometry.bounds, obj=id_num)
+    # Read the university locations and project them to
+    # EPSG:2163 https://epsg.io/2163 in one call, reusing the
+    # projected coordinates while the spreadsheet is unchanged
+    # (see reproject.py)
+    def read_universities():
+        universities = pd.read_excel(DATASETS_PATH + au_file_name, index_col='ID number')
+        return (universities.index.values,
+                universities['Longitude location of institution'].values,
+                universities['Latitude location of institution'].values)
+
+    uni_ids, uni_x, uni_y = reproject.cached_projection([DATASETS_PATH + au_file_name], DATASETS_PATH + 'university_points.npz', read_universities)
+    uni_xy = np.column_stack([uni_x, uni_y])
         
     ################################ CENSUS TRACT SHAPE FILES ################################  
     print('Downloading census tract shapefiles data...')
@@ -160,82 +164,18 @@ if __name__ == '__main__':
             subprocess.call(['rm', '-rf', CENSUS_TRACTS_PATH + state + '.zip'])
     
     # ----------------------------
-    # Let's calculate and store each of 
-    # the centroids of each
-    # census tract in a list of tuples
-    tract_centroids = []
-
-    # ----------------------------
-    # Let's store a list of each census 
-    # tract's geometry as well
-    tract_list = []
-
-    for subdir, dirs, files in list(os.walk(CENSUS_TRACTS_PATH))[1:]:
-
-        # Opening the shapefile
-        state_shapes = fiona.open(subdir, 'r')
-
-        # Looping through each census tract in each state and 
-        # making key: geoid, value: centroid position
-        # of (longitude, latitude) as well as building the 
-        # RTree index for census tracts
-        for idx, census_tract in enumerate(state_shapes):
-
-            geoid = census_tract['properties']['GEOID']
-            geometry = np.array(census_tract['geometry']['coordinates'])
-            points = None
-
-            # Some of the geometries are in a 2d and some in 3d array
-            if len([True for lat_long in geometry[0] if len(lat_long) != 2]) > 0:
-
-                # Create the Multipoint object to find centroid
-                points = MultiPoint(geometry[0][0])
-
-            else:
-
-                # Create the Multipoint object to find centroid
-                points = MultiPoint(geometry[0])
-
-            # ----------------------------
-            # Create Census tract Polygon
-            tract = shapely.geometry.shape(census_tract['geometry'])
-
-            # ----------------------------
-            # Store the Census tract Polygon
-            # in our list for the RTree index
-            # later on
-            tract_list.append((geoid, tract))
-
-            # ----------------------------
-            # Create Census tract Centroid
-            # True centroid, not necessarily an existing point
-            centroid_pt = points.centroid
-
-            # A represenative point, not centroid,
-            # that is guarnateed to be with the geometry
-            tract_centroids.append((geoid, shapely.geometry.shape(points.representative_point())))
-    
-    # Setting our coordinate system for the tracts 
-    # and universities to EPSG:2163 https://epsg.io/2163
-    tract_gdf = gpd.GeoDataFrame(geometry=[tract_shape for geoid, tract_shape in tract_list], index=[geoid for geoid, tract_pt in tract_list])
-    tract_gdf.crs = {'init': 'epsg:4269'}
-    tract_gdf.to_crs({'init': 'epsg:2163'}, inplace=True)
-
-    tract_centroids_gdf = gpd.GeoDataFrame(geometry=[tract_pt for geoid, tract_pt in tract_centroids], index=[geoid for geoid, tract_pt in tract_centroids])
-    tract_centroids_gdf.crs = {'init': 'epsg:4269'}
-    tract_centroids_gdf.to_crs({'init': 'epsg:2163'}, inplace=True)
-    
-    # ----------------------------
-    # Initialize rtree spatial index
-    # for census tract centroids with
-    # CENTROID point bounding box
-    tract_centroid_index = rtree.index.Index()
-
-    # Iterate over all census tract centroids
-    for idx, (geoid, centroid) in tqdm(enumerate(tract_centroids_gdf.iterrows())):
-
-        # add coordinates of census tract and store geoid along with it
-        tract_centroid_index.insert(idx, coordinates=centroid.geometry.bounds, obj=geoid)
+    # Let's calculate the representative point
+    # of each census tract, one state per process
+    # (see tract_shapes.py), and project them all
+    # to EPSG:2163 in one call. The projected points
+    # are reused while the shapefiles are unchanged.
+    # None of the later stages need the full tract
+    # polygons, so none are kept.
+    state_dirs = [subdir for subdir, dirs, files in list(os.walk(CENSUS_TRACTS_PATH))[1:]]
+    state_files = sorted(os.path.join(subdir, f) for subdir in state_dirs for f in os.listdir(subdir))
+    tract_geoids, tract_x, tract_y = reproject.cached_projection(state_files, DATASETS_PATH + 'tract_points.npz',
+                                                                 lambda: tract_shapes.read_states(state_dirs)[:3])
+    tract_centroids_xy = np.column_stack([tract_x, tract_y])
     
     ################################ CENSUS TRACTS WITHIN BUFFER RADIUS ################################ 
     print('Finding census tracts that are within buffer radius...')
@@ -243,28 +183,9 @@ if __name__ == '__main__':
     # Value: List(GeoID)
     # Contains which census tract centroids are accessible to 
     # that census tract within BUFFER radius
-    tracts_in_buffer = defaultdict(list)
-
-    # 1. Go through each census tract centroid
-    # 2. Create a BOUNDING BOX of BUFFER radius around that centroid
-    # 3. Find which centroids are inside that BOX
-    # 4. Check if that centroid exists in the BUFFER CIRCLE of the census tract 
-    for idx, (geoid, centroid) in tqdm(enumerate(tract_centroids_gdf.iterrows())):
-
-        tracts_in_buffer[geoid] = []
-
-        # get iterable (generator) of indices from RTree index of census tracts centroids
-        # that are contained within a BUFFER BOX of the current centroid
-        # http://toblerity.org/rtree/tutorial.html#intersection
-        for overlapping_ind in tract_centroid_index.intersection(centroid.geometry.buffer(BUFFER).bounds):
-
-            # Check if current tract centroid's BUFFER CIRCLE
-            # contains the overlapping index's CENTROID
-            if tract_centroids_gdf.iloc[overlapping_ind].name != geoid and centroid.geometry.buffer(BUFFER).contains(shapely.geometry.shape(tract_centroids_gdf.iloc[overlapping_ind].geometry)):
-
-                # add the overlapping_ind's geoID of the census tract into the current census tract's list
-                # of census tracts accessible within buffer radius
-                tracts_in_buffer[geoid].append(tract_centroids_gdf.iloc[overlapping_ind].name)
+    # (KD-tree radius query over the projected centroids, sharded by state
+    # across a process pool; see tract_buffers.py)
+    tracts_in_buffer = tract_buffers.tracts_in_buffer(tract_geoids, tract_centroids_xy, BUFFER)
      
     # Store centroid BUFFER dict to file
     print('Saving to ./datasets/tracts_in_buffer.json...')
@@ -277,28 +198,10 @@ if __name__ == '__main__':
     # Value: List(id_num of university)
     # Contains which universities are accessible to 
     # that census tract within BUFFER radius
-    tract_universities = defaultdict(list)
-
-    # 1. Go through each census tract centroid
-    # 2. Create a BOUNDING BOX of BUFFER radius around that centroid
-    # 3. Find which universities are inside that BOX
-    # 4. Check if that university exists in the BUFFER CIRCLE of the census tract 
-    for idx, (geoid, centroid) in tqdm(enumerate(tract_centroids_gdf.iterrows())):
-
-        tract_universities[geoid] = []
-
-        # get iterable (generator) of indices from RTree index of universities
-        # that are contained within a BUFFER BOX of the current centroid
-        # http://toblerity.org/rtree/tutorial.html#intersection
-        for overlapping_ind in uni_index.intersection(centroid.geometry.buffer(BUFFER).bounds):
-
-            # Check if current tract centroid's BUFFER CIRCLE
-            # contains the overlapping UNIVERSITY index's centre point
-            if centroid.geometry.buffer(BUFFER).contains(shapely.geometry.shape(uni_gdf.iloc[overlapping_ind].geometry)):
-
-                # add the overlapping_ind's geoID of the census tract into the current census tract's list
-                # of census tracts accessible within buffer radius
-                tract_universities[geoid].append(str(uni_gdf.iloc[overlapping_ind].name))
+    # (KD-tree radius query over the projected university points,
+    # with the same buffer test as above; see tract_buffers.py)
+    tract_universities = {geoid: uni_ids[found].tolist() for geoid, found in
+                          zip(tract_geoids.tolist(), tract_buffers.points_in_buffer(tract_centroids_xy, uni_xy, BUFFER))}
     
     # Store centroid BUFFER dict of universities to file
     print('Saving to ./datasets/tract_universities.json...')
@@ -318,4 +221,17 @@ if __name__ == '__main__':
     
     # Write to csv file
     print('Saving to ./datasets/education_deserts.csv...')
-    education_deserts.to_csv(r'./datasets/education_deserts.csv')
\ No newline at end of file
+    education_deserts.to_csv(r'./datasets/education_deserts.csv')
+    
+    ################################ ACCESSIBILITY INDEX ################################ 
+    print('Building university accessibility index...')
+    # Distance from each census tract to its nearest universities, so
+    # deserts for any radius can be derived without redoing the geometry
+    accessibility_index = accessibility.build_index(tract_geoids, tract_centroids_xy, uni_ids, uni_xy,
+                                                    k=NEAREST_UNIVERSITIES)
+    print('Saving to ./datasets/university_distances.npz...')
+    accessibility.save_index(accessibility_index, './datasets/university_distances.npz')
+
+    for miles in DESERT_RADII:
+        print('Saving to ./datasets/education_deserts_{}mi.csv...'.format(miles))
+        accessibility.education_deserts(accessibility_index, miles).to_csv('./datasets/education_deserts_{}mi.csv'.format(miles))
@@ -0,0 +1,273 @@
+import time
+import numpy as np
+from scipy import sparse
+from scipy.optimize import milp, LinearConstraint, Bounds
+from scipy.sparse.csgraph import connected_components
+from network_reader import CSRNetwork
+import profiling
+
+# Components with more sites than this are solved once, sharing the
+# budget with the small ones, rather than once per budget (see solve)
+SMALL_COMPONENT = 100
+
+def coverage_matrix(network):
+    """Sites x tracts 0/1 matrix: row i marks the tracts taking site i covers."""
+    n = len(network.geo_ids)
+    cover = sparse.csr_matrix((np.ones(len(network.indices)), np.array(network.indices), np.array(network.indptr)), shape=(n, n))
+    cover.sum_duplicates()
+    cover.data[:] = 1.0
+    return cover
+
+def components(cover, weights):
+    """Splits the coverage problem into independent pieces.
+
+    Tracts of zero weight are dropped, as are sites that cover no tract of
+    positive weight (leaving one of those out never lowers the value). The
+    rest fall into connected components of the site-tract graph: sites in
+    different components share no tract, so each can be solved on its own.
+    Returns a list of (sites, tracts) index arrays.
+    """
+    tracts = np.flatnonzero(weights != 0)
+    cover = cover[:, tracts]
+    sites = np.flatnonzero(cover[:, weights[tracts] > 0].getnnz(axis=1) > 0)
+    cover = cover[sites]
+    m = len(sites)
+    graph = sparse.bmat([[None, cover], [cover.T, None]], format='csr')
+    count, labels = connected_components(graph, directed=False)
+    site_labels, tract_labels = labels[:m], labels[m:]
+    site_order = np.argsort(site_labels, kind='stable')
+    tract_order = np.argsort(tract_labels, kind='stable')
+    site_bounds = np.searchsorted(site_labels[site_order], np.arange(count + 1))
+    tract_bounds = np.searchsorted(tract_labels[tract_order], np.arange(count + 1))
+    pieces = []
+    for c in range(count):
+        if site_bounds[c] == site_bounds[c+1]:
+            continue
+        pieces.append((sites[site_order[site_bounds[c]:site_bounds[c+1]]], tracts[tract_order[tract_bounds[c]:tract_bounds[c+1]]]))
+    return pieces
+
+def coverage_value(cover, weights, chosen):
+    covered = np.asarray(cover[chosen].sum(axis=0)).ravel() > 0
+    return float(weights[covered].sum())
+
+def solve_budget(cover, weights, budget, time_limit=None, rest=None):
+    """Best set of at most budget sites for one component, as a MILP.
+
+    x_i = 1 when site i is taken and y_j = 1 when tract j counts as
+    covered. A tract of positive weight can only count if some site taken
+    covers it; one of negative weight must count once any does. rest, if
+    given, is the best value the rest of the problem reaches with each
+    budget 0..budget (see combine); the budget row is then shared with
+    it, z_b = 1 giving it b sites. Returns (chosen site positions, value,
+    upper bound, proven optimal, sites given to the rest).
+    """
+    m, e = cover.shape
+    rest = np.zeros(1) if rest is None else np.asarray(rest[:budget+1], dtype=float)
+    r = len(rest)
+    positive = weights > 0
+    cover = cover.tocsc()
+    gain_rows = sparse.hstack([-cover[:, positive].T, sparse.identity(e, format='csr')[positive], sparse.csr_matrix((int(positive.sum()), r))])
+    loss = cover[:, ~positive].tocoo()
+    loss_y = np.flatnonzero(~positive)[loss.col]
+    loss_rows = sparse.csr_matrix((np.concatenate([np.ones(loss.nnz), -np.ones(loss.nnz)]),
+                                   (np.tile(np.arange(loss.nnz), 2), np.concatenate([loss.row, m + loss_y]))),
+                                  shape=(loss.nnz, m + e + r))
+    budget_row = sparse.csr_matrix(np.concatenate([np.ones(m), np.zeros(e), np.arange(r)]))
+    rest_row = sparse.csr_matrix(np.concatenate([np.zeros(m + e), np.ones(r)]))
+    lower = np.concatenate([np.full(gain_rows.shape[0] + loss.nnz + 1, -np.inf), [1]])
+    upper = np.concatenate([np.zeros(gain_rows.shape[0] + loss.nnz), [budget, 1]])
+    constraints = LinearConstraint(sparse.vstack([gain_rows, loss_rows, budget_row, rest_row], format='csr'), lower, upper)
+    options = {} if time_limit is None else {'time_limit': time_limit}
+    profiling.count('milp_solves')
+    res = milp(np.concatenate([np.zeros(m), -weights, -rest]), integrality=np.concatenate([np.ones(m), np.zeros(e), np.ones(r)]),
+               bounds=Bounds(0, 1), constraints=constraints, options=options)
+    if res.x is None:
+        chosen, value, rest_budget = np.array([], dtype=np.int64), 0.0, 0
+    else:
+        chosen = np.flatnonzero(res.x[:m] > 0.5)
+        rest_budget = int(np.argmax(res.x[m+e:]))
+        value = coverage_value(cover.tocsr(), weights, chosen) + float(rest[rest_budget])
+    dual = getattr(res, 'mip_dual_bound', None)
+    bound = -dual if dual is not None and np.isfinite(dual) else np.inf
+    proven = res.status == 0
+    return chosen, value, max(value, bound) if not proven else value, proven, rest_budget
+
+def reaches(value, bound):
+    # value >= bound, but for rounding: sums in another order can differ
+    return value >= bound - 1e-9 * max(1.0, abs(bound))
+
+def greedy_curve(cover, weights, k):
+    # Greedy within one component, stopping once no site adds value: the
+    # incumbent each budget's MILP has to beat
+    cover = cover.tocsr()
+    remaining = weights.copy()
+    values, sets = [0.0], [[]]
+    for budget in range(min(k, cover.shape[0])):
+        gains = cover @ remaining
+        best = int(np.argmax(gains))
+        if gains[best] <= 0:
+            break
+        remaining[cover.indices[cover.indptr[best]:cover.indptr[best+1]]] = 0.0
+        values.append(values[-1] + float(gains[best]))
+        sets.append(sets[-1] + [best])
+    return values, sets
+
+def bound_curve(cover, weights, k):
+    # Upper bounds for budgets 0..k needing no solver: one site is exact,
+    # each one more adds at most the positive weight a single site
+    # covers, and no budget beats covering every positive-weight tract
+    positive = np.where(weights > 0, weights, 0.0)
+    bounds = np.minimum(np.arange(k + 1) * max(float((cover @ positive).max()), 0.0), float(positive.sum()))
+    bounds[1:2] = max(float((cover @ weights).max()), 0.0)
+    return bounds
+
+def component_curve(cover, weights, k, deadline=None):
+    """Best value (and an upper bound on it) for every budget 0..k of one component.
+
+    Budgets are solved in increasing order until the component is
+    saturated, i.e. every positive-weight tract is covered, after which
+    more sites cannot help. Budget 1 needs no solver, and neither does a
+    budget where greedy reaches the previous budget's bound plus what one
+    more site can add (see bound_curve); the greedy answer stands for any
+    budget whose MILP does not beat it. Past deadline (time.monotonic()), no more MILPs run and
+    the rest of the budgets keep the greedy values.
+    """
+    m = cover.shape[0]
+    ceiling = float(weights[weights > 0].sum())
+    step = bound_curve(cover, weights, 1)[1]
+    greedy_values, greedy_sets = greedy_curve(cover, weights, k)
+    single = cover @ weights
+    one = max(float(single.max()), 0.0)
+    lower, upper, sets, proven = [0.0, one], [0.0, one], [[], greedy_sets[1] if one > 0 else []], True
+    for budget in range(2, min(k, m) + 1):
+        if lower[-1] >= ceiling:
+            break
+        incumbent = min(budget, len(greedy_values) - 1)
+        bound = min(upper[-1] + step, ceiling)
+        time_left = None if deadline is None else deadline - time.monotonic()
+        if reaches(greedy_values[incumbent], bound) or (time_left is not None and time_left <= 0):
+            chosen, value, optimal = [], 0.0, reaches(greedy_values[incumbent], bound)
+        else:
+            chosen, value, bound, optimal, _ = solve_budget(cover, weights, budget, time_left)
+            bound = min(bound, upper[-1] + step, ceiling)
+        proven = proven and optimal
+        for old_value, old_set in [(lower[-1], sets[-1]), (greedy_values[incumbent], greedy_sets[incumbent])]:
+            if value < old_value:
+                chosen, value = old_set, old_value
+        lower.append(value)
+        upper.append(max(upper[-1], bound, value))
+        sets.append(list(chosen))
+    return np.array(lower), np.array(upper), sets, proven
+
+def combine(curves, k):
+    """Splits every budget 0..k across components to maximize the summed curves.
+
+    curves holds one nondecreasing array per component, indexed by the
+    number of sites it gets. Returns the best total for each budget and
+    the choices split needs to recover the split.
+    """
+    best = np.zeros(k + 1)
+    choices = []
+    for curve in curves:
+        combined = best.copy()
+        choice = np.zeros(k + 1, dtype=np.int64)
+        for b in range(1, min(len(curve) - 1, k) + 1):
+            candidate = best[:k+1-b] + curve[b]
+            better = candidate > combined[b:]
+            combined[b:][better] = candidate[better]
+            choice[b:][better] = b
+        best = combined
+        choices.append(choice)
+    return best, choices
+
+def split(choices, budget):
+    """Sites per component in combine's best split of budget."""
+    budgets = [0] * len(choices)
+    for c in range(len(choices) - 1, -1, -1):
+        budgets[c] = int(choices[c][budget])
+        budget -= budgets[c]
+    return budgets
+
+def greedy_value(network, k):
+    """Value and sites of top_k_locations' greedy answer, leaving network untouched."""
+    copy = CSRNetwork(network.geo_ids, network.indptr, network.indices, network.values.copy(), network.is_int.copy())
+    copy.initial_sort()
+    sites = []
+    total = 0.0
+    for i in range(k):
+        if i > 0:
+            copy.next_best()
+        geo_id, value = copy.take()
+        sites.append(geo_id)
+        total += value
+    return total, sites
+
+def solve(network, k, time_limit=60, small=SMALL_COMPONENT):
+    """Exact budgeted coverage for a CSRNetwork, with the greedy answer's gap.
+
+    Maximizes the total weight of the tracts covered by k sites, the
+    objective top_k_locations attacks greedily. Components (see
+    components) of at most small sites are solved as a MILP with HiGHS
+    for each budget up to saturation (see component_curve) and combined
+    by dynamic programming; the larger ones are solved together as one
+    MILP whose budget row they share with the small ones' combined
+    curve. time_limit (seconds) bounds the whole solve; once it runs
+    out, the best sets found so far are used and the bound stays valid
+    but loose. The answer is never worse than greedy's.
+
+    Returns a dict of sites, value, upper_bound, proven (whether value is
+    known optimal), greedy_sites, greedy_value and gap, the greedy
+    answer's largest possible shortfall as a fraction of upper_bound.
+    """
+    deadline = time.monotonic() + time_limit
+    with profiling.span('components', 'Splitting into components'):
+        cover = coverage_matrix(network)
+        weights = np.asarray(network.values, dtype=float)
+        pieces = components(cover, weights)
+    large = [(sites, tracts) for sites, tracts in pieces if len(sites) > small]
+    pieces = [(sites, tracts) for sites, tracts in pieces if len(sites) <= small]
+    print('Found ' + str(len(pieces)) + ' small and ' + str(len(large)) + ' large components')
+    profiling.count('components', len(pieces) + len(large))
+
+    with profiling.span('component_solves', 'Solving small components'):
+        lowers, uppers, all_sets, proven = [], [], [], True
+        for sites, tracts in pieces:
+            lower, upper, sets, optimal = component_curve(cover[sites][:, tracts], weights[tracts], k, deadline)
+            lowers.append(lower)
+            uppers.append(upper)
+            all_sets.append([sites[chosen] for chosen in sets])
+            proven = proven and optimal
+    best, choices = combine(lowers, k)
+    small_upper, _ = combine(uppers, k)
+
+    greedy_total, greedy_sites = greedy_value(network, k)
+    chosen, budget = [], k
+    upper_bound = small_upper[k]
+    if large:
+        with profiling.span('large_solve', 'Solving large components'):
+            sites = np.concatenate([sites for sites, _ in large])
+            tracts = np.concatenate([tracts for _, tracts in large])
+            large_upper, _ = combine(uppers + [bound_curve(cover[s][:, t], weights[t], k) for s, t in large], k)
+            upper_bound = large_upper[k]
+            time_left = deadline - time.monotonic()
+            # Not worth a MILP if greedy already reaches the bound
+            if time_left > 0 and not reaches(greedy_total, upper_bound):
+                positions, _, bound, optimal, budget = solve_budget(cover[sites][:, tracts], weights[tracts], k, time_left, best)
+                chosen = sites[positions].tolist()
+                # The small components' curves are lower bounds, so their
+                # slack is added to the MILP's bound
+                upper_bound = min(upper_bound, bound + float((small_upper - best).max()))
+                proven = proven and optimal
+            else:
+                proven = False
+    chosen += [key for sets, b in zip(all_sets, split(choices, budget)) for key in sets[b]]
+    # Exact sums over the chosen sites rather than the DP's
+    value = coverage_value(cover, weights, np.array(chosen, dtype=np.int64))
+    sites = [network.get_geo_id(int(key)) for key in chosen]
+    if greedy_total > value:
+        sites, value = greedy_sites, greedy_total
+    proven = proven or reaches(value, upper_bound)
+    upper_bound = max(upper_bound, value)
+    gap = max(upper_bound - greedy_total, 0.0) / upper_bound if upper_bound > 0 else 0.0
+    return {'sites': sites, 'value': value, 'upper_bound': upper_bound, 'proven': proven,
+            'greedy_sites': greedy_sites, 'greedy_value': greedy_total, 'gap': gap}
@@ -0,0 +1,184 @@
+"""Model and feature-subset comparison for the pct. bachelors regression.
+
+    python experiments.py --models LinearRegression RandomForest --features 10 20 all
+
+Runs every (model, feature subset, fold) cell of the grid over a process
+pool, like the notebooks' cross_validate comparison and RFE sweep, and
+memoizes each cell's scores and fit/predict times on disk so a rerun
+only computes cells it has not seen. Feature subsets are the top n
+features of an RFE ranking (itself cached) or all of them.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.feature_selection import RFE
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import KFold
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVR
+import census_ingest
+import profiling
+
+MODELS = {
+    'LinearRegression': make_pipeline(StandardScaler(), LinearRegression()),
+    'SVR': make_pipeline(StandardScaler(), SVR(kernel='rbf')),
+    'RandomForest': make_pipeline(StandardScaler(), RandomForestRegressor(n_estimators=100, n_jobs=1)),
+    'GaussianProcess': make_pipeline(StandardScaler(), GaussianProcessRegressor()),
+}
+try:
+    from xgboost import XGBRegressor
+    MODELS['XGB'] = make_pipeline(StandardScaler(), XGBRegressor(n_jobs=1))
+except ImportError:
+    pass
+
+# Models that are only fit on a random subsample of each training fold,
+# as the notebook does for the Gaussian process
+MAX_TRAIN_ROWS = {'GaussianProcess': 1000}
+
+FEATURES = [feature for feature in census_ingest.TRAIN_FEATURES if feature != 'geoID']
+
+def training_data(census_file, dataset='balanced', seed=0):
+    """(X, y) as the regression notebook builds them.
+
+    dataset is 'balanced' (every desert plus as many non-deserts drawn
+    at random), 'nondesert' or 'all'.
+    """
+    df = census_ingest.read_cached(census_file, census_ingest.TRAIN_FEATURES + census_ingest.LABEL_FEATURES)
+    if dataset == 'balanced':
+        deserts = df.index[df['Education Desert'] == 1].values
+        nondeserts = df.index[df['Education Desert'] == 0].values
+        rows = np.hstack([np.random.default_rng(seed).choice(nondeserts, len(deserts)), deserts])
+        df = df.loc[rows]
+    elif dataset == 'nondesert':
+        df = df[df['Education Desert'] == 0]
+    X = df[FEATURES].values.astype(np.float64)
+    y = sum(df[feature].values.astype(np.float64) for feature in census_ingest.LABEL_FEATURES)
+    return X, y
+
+def data_hash(X, y):
+    sha = hashlib.sha256()
+    sha.update(np.ascontiguousarray(X).tobytes())
+    sha.update(np.ascontiguousarray(y).tobytes())
+    return sha.hexdigest()
+
+def feature_ranking(X, y, cache_dir, key, step=5):
+    # RFE ranking of FEATURES (best first), fit once per data set
+    ranking_file = os.path.join(cache_dir, 'ranking_' + key[:16] + '.json')
+    if os.path.isfile(ranking_file):
+        with open(ranking_file) as f:
+            return json.load(f)
+    selector = RFE(RandomForestRegressor(n_estimators=50, n_jobs=-1, random_state=0), n_features_to_select=1, step=step)
+    selector.fit(X, y)
+    ranking = [int(i) for i in np.argsort(selector.ranking_, kind='stable')]
+    with open(ranking_file, 'w') as f:
+        json.dump(ranking, f)
+    return ranking
+
+def cell_key(data_key, model, columns, fold, folds, seed):
+    spec = json.dumps([data_key, model, repr(MODELS[model]), columns, fold, folds, seed])
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+# Training data shared by the worker processes, memory-mapped
+X_shared = None
+y_shared = None
+
+def init_worker(data_dir):
+    global X_shared, y_shared
+    X_shared = np.load(os.path.join(data_dir, 'X.npy'), mmap_mode='r')
+    y_shared = np.load(os.path.join(data_dir, 'y.npy'), mmap_mode='r')
+
+def run_cell(args):
+    # Fits one model on one fold of one feature subset
+    key, model, columns, train, test, seed, cell_file = args
+    columns = np.array(columns)
+    if model in MAX_TRAIN_ROWS and len(train) > MAX_TRAIN_ROWS[model]:
+        train = np.sort(np.random.default_rng(seed).choice(train, MAX_TRAIN_ROWS[model], replace=False))
+    estimator = clone(MODELS[model])
+    start = time.time()
+    estimator.fit(X_shared[train][:, columns], y_shared[train])
+    fit_time = time.time() - start
+    start = time.time()
+    pred = estimator.predict(X_shared[test][:, columns])
+    predict_time = time.time() - start
+    y_test = y_shared[test]
+    result = {'r2': r2_score(y_test, pred), 'mse': mean_squared_error(y_test, pred), 'mae': mean_absolute_error(y_test, pred),
+              'fit_time': fit_time, 'predict_time': predict_time}
+    # Written under a temporary name first, so an interrupted run never
+    # leaves a half-written cell behind
+    with open(cell_file + '.tmp', 'w') as f:
+        json.dump(result, f)
+    os.replace(cell_file + '.tmp', cell_file)
+    return key
+
+def run(census_file, models, feature_counts, dataset='balanced', folds=5, seed=0, processes=None, cache_dir='experiments_cache'):
+    """Runs (or reads back) every cell of the grid, returning one row per cell.
+
+    feature_counts lists subset sizes (top n of the RFE ranking), with
+    None meaning every feature.
+    """
+    X, y = training_data(census_file, dataset, seed)
+    data_key = data_hash(X, y)
+    data_dir = os.path.join(cache_dir, 'data_' + data_key[:16])
+    os.makedirs(data_dir, exist_ok=True)
+    if not os.path.isfile(os.path.join(data_dir, 'y.npy')):
+        np.save(os.path.join(data_dir, 'X.npy'), X)
+        np.save(os.path.join(data_dir, 'y.npy'), y)
+    ranking = feature_ranking(X, y, cache_dir, data_key) if any(count is not None for count in feature_counts) else None
+    splits = list(KFold(folds, shuffle=True, random_state=seed).split(X))
+
+    cells = []
+    tasks = []
+    for model in models:
+        for count in feature_counts:
+            columns = sorted(ranking[:count]) if count is not None else list(range(len(FEATURES)))
+            for fold, (train, test) in enumerate(splits):
+                key = cell_key(data_key, model, columns, fold, folds, seed)
+                cell_file = os.path.join(cache_dir, key + '.json')
+                cells.append((model, 'all' if count is None else count, fold, cell_file))
+                if not os.path.isfile(cell_file):
+                    tasks.append((key, model, columns, train, test, seed, cell_file))
+    print('Running ' + str(len(tasks)) + ' of ' + str(len(cells)) + ' cells')
+    if tasks:
+        with profiling.span('experiment_cells', 'Running cells'):
+            with Pool(processes, init_worker, (data_dir,)) as pool:
+                for done, _ in enumerate(pool.imap_unordered(run_cell, tasks), 1):
+                    print('Finished ' + str(done) + '/' + str(len(tasks)) + ' cells', end='\r')
+            print()
+
+    rows = []
+    for model, count, fold, cell_file in cells:
+        with open(cell_file) as f:
+            rows.append(dict({'model': model, 'features': count, 'fold': fold}, **json.load(f)))
+    return pd.DataFrame(rows)
+
+def summarize(results):
+    """Mean scores and times per (model, feature subset), best r2 first."""
+    summary = results.groupby(['model', 'features'], sort=False)[['r2', 'mse', 'mae', 'fit_time', 'predict_time']].mean()
+    return summary.sort_values('r2', ascending=False).reset_index()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--census', default='../data/census_tract_feats.csv')
+    parser.add_argument('--dataset', choices=['balanced', 'nondesert', 'all'], default='balanced')
+    parser.add_argument('--models', nargs='+', choices=sorted(MODELS), default=['LinearRegression', 'RandomForest'])
+    parser.add_argument('--features', nargs='+', default=['all'], help='subset sizes (top n of the RFE ranking) or all')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--cache-dir', default='experiments_cache')
+    parser.add_argument('--output', default='experiment_results.csv')
+    args = parser.parse_args()
+    feature_counts = [None if count == 'all' else int(count) for count in args.features]
+    results = run(args.census, args.models, feature_counts, args.dataset, args.folds, args.seed, args.processes, args.cache_dir)
+    results.to_csv(args.output, index=False)
+    print(summarize(results).to_string(index=False))
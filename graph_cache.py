@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import heapq
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+import profiling
+
+# Arrays making up a cached graph; see csr_from_adjacency
+ARRAYS = ['geo_ids', 'indptr', 'indices', 'is_key']
+
+def csr_from_adjacency(nodes):
+    """Converts a tracts_in_buffer dict into CSR arrays.
+
+    Nodes are numbered by first appearance, as a key or as a neighbor,
+    which is the order Network creates them in. Row i holds i itself
+    followed by its neighbors in file order. is_key marks nodes that are
+    keys of the file (only those are given a weight).
+    """
+    index = {}
+    key_ptr = [0]
+    key_indices = []
+    for key in nodes.keys():
+        key_indices.append(index.setdefault(key, len(index)))
+        key_indices.extend([index.setdefault(neighbor, len(index)) for neighbor in nodes[key]])
+        key_ptr.append(len(key_indices))
+    geo_ids = np.array(list(index.keys()))
+    key_ptr = np.array(key_ptr, dtype=np.int64)
+    key_indices = np.array(key_indices, dtype=np.int32)
+    # Rows above are in file order; move each one to its node's slot.
+    # Tracts that only ever appear as neighbors keep just themselves.
+    key_rows = key_indices[key_ptr[:-1]]
+    lengths = np.ones(len(geo_ids), dtype=np.int64)
+    lengths[key_rows] = np.diff(key_ptr)
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    indices = np.repeat(np.arange(len(geo_ids), dtype=np.int32), lengths)
+    entry_rows = np.repeat(np.arange(len(key_rows)), np.diff(key_ptr))
+    indices[indptr[key_rows][entry_rows] + np.arange(len(key_indices)) - key_ptr[entry_rows]] = key_indices
+    is_key = np.zeros(len(geo_ids), dtype=bool)
+    is_key[key_rows] = True
+    return {'geo_ids': geo_ids, 'indptr': indptr, 'indices': indices, 'is_key': is_key}
+
+def shards(graph, count):
+    """Splits a graph's nodes into at most count independent groups.
+
+    Taking a site only changes the values of rows in its own weakly
+    connected component, so components can be optimized separately. They
+    are packed largest first into whichever group is smallest so far.
+    Returns one sorted array of node numbers per group.
+    """
+    n = len(graph['geo_ids'])
+    adjacency = sparse.csr_matrix((np.ones(len(graph['indices']), dtype=bool), np.asarray(graph['indices']), np.asarray(graph['indptr'])), shape=(n, n))
+    num_components, labels = connected_components(adjacency, directed=True, connection='weak')
+    sizes = np.bincount(labels, minlength=num_components)
+    groups = [(0, i, []) for i in range(min(count, num_components))]
+    for component in np.argsort(-sizes, kind='stable'):
+        size, i, members = heapq.heappop(groups)
+        members.append(component)
+        heapq.heappush(groups, (size + sizes[component], i, members))
+    group_of = np.empty(num_components, dtype=np.int64)
+    for _, i, members in groups:
+        group_of[members] = i
+    node_groups = group_of[labels]
+    return [np.flatnonzero(node_groups == i) for i in range(len(groups))]
+
+def subgraph(graph, nodes):
+    """The CSR arrays restricted to nodes (sorted, closed under neighbors), renumbered in order."""
+    indptr = np.asarray(graph['indptr'])
+    renumber = np.full(len(graph['geo_ids']), -1, dtype=np.int32)
+    renumber[nodes] = np.arange(len(nodes), dtype=np.int32)
+    lengths = indptr[nodes + 1] - indptr[nodes]
+    positions = np.repeat(indptr[nodes] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return {'geo_ids': np.asarray(graph['geo_ids'])[nodes], 'indptr': np.concatenate([[0], np.cumsum(lengths)]),
+            'indices': renumber[np.asarray(graph['indices'])[positions]], 'is_key': np.asarray(graph['is_key'])[nodes]}
+
+def file_hash(filename):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def graph_sha256(json_filename, cache_dir=None):
+    """sha256 of json_filename, read from its cache's meta.json when that is fresh."""
+    cache_dir = cache_dir or default_cache_dir(json_filename)
+    if is_fresh(json_filename, cache_dir):
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            return json.load(f)['sha256']
+    return file_hash(json_filename)
+
+def default_cache_dir(json_filename):
+    return json_filename + '.cache'
+
+def is_fresh(json_filename, cache_dir):
+    # A changed mtime only invalidates the cache if the contents changed too
+    meta_filename = os.path.join(cache_dir, 'meta.json')
+    if not os.path.isfile(meta_filename):
+        return False
+    with open(meta_filename) as f:
+        meta = json.load(f)
+    stat = os.stat(json_filename)
+    if meta['mtime_ns'] == stat.st_mtime_ns and meta['size'] == stat.st_size:
+        return True
+    if meta['size'] != stat.st_size or meta['sha256'] != file_hash(json_filename):
+        return False
+    meta['mtime_ns'] = stat.st_mtime_ns
+    with open(meta_filename, 'w') as f:
+        json.dump(meta, f)
+    return True
+
+def build_cache(json_filename, cache_dir):
+    with profiling.span('json_load', 'Reading JSON'):
+        with open(json_filename) as json_file:
+            nodes = json.load(json_file)
+    with profiling.span('cache_build', 'Writing graph cache'):
+        arrays = csr_from_adjacency(nodes)
+        os.makedirs(cache_dir, exist_ok=True)
+        # meta.json is written last, so a half-written cache is never fresh
+        meta_filename = os.path.join(cache_dir, 'meta.json')
+        if os.path.isfile(meta_filename):
+            os.remove(meta_filename)
+        for name in ARRAYS:
+            np.save(os.path.join(cache_dir, name + '.npy'), arrays[name])
+        stat = os.stat(json_filename)
+        with open(meta_filename, 'w') as f:
+            json.dump({'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': file_hash(json_filename)}, f)
+
+# Distance decay functions: the share of a tract's value a site at
+# distance d (metres) captures, for neighborhoods of the given radius
+DECAY = {
+    'binary': lambda d, radius: np.ones_like(d),
+    'linear': lambda d, radius: 1 - d / radius,
+    'gaussian': lambda d, radius: np.exp(-2 * (d / radius)**2),
+}
+
+def edge_decay(graph, geo_ids, xy, kind, radius):
+    """One decay factor per CSR entry, from the distance between its row's tract and the entry's."""
+    index = {geo_id: i for i, geo_id in enumerate(geo_ids)}
+    rows = np.array([index.get(geo_id, -1) for geo_id in graph['geo_ids'].tolist()], dtype=np.int64)
+    if (rows < 0).any():
+        missing = np.asarray(graph['geo_ids'])[rows < 0]
+        raise ValueError('{} tracts of the graph have no coordinates, e.g. {}'.format(len(missing), missing[:10].tolist()))
+    points = np.asarray(xy, dtype=float)[rows]
+    entry_rows = np.repeat(np.arange(len(rows)), np.diff(graph['indptr']))
+    distance = np.hypot(*(points[entry_rows] - points[np.asarray(graph['indices'])]).T)
+    return np.clip(DECAY[kind](distance, radius), 0, 1).astype(np.float16)
+
+def load_decay(json_filename, points_file, kind='linear', radius=40233.6, cache_dir=None):
+    """Decay factors for load_graph's entries, memory-mapped read-only.
+
+    points_file holds the projected tract points (ids, x, y), as
+    reproject.cached_projection writes. The factors are stored as
+    float16 next to the graph cache and recomputed when the graph, the
+    points, the kind or the radius change.
+    """
+    cache_dir = cache_dir or default_cache_dir(json_filename)
+    graph = load_graph(json_filename, cache_dir)
+    with open(os.path.join(cache_dir, 'meta.json')) as f:
+        key = {'graph': json.load(f)['sha256'], 'points': file_hash(points_file), 'radius': radius}
+    decay_filename = os.path.join(cache_dir, 'decay_' + kind + '.npy')
+    meta_filename = os.path.join(cache_dir, 'decay_' + kind + '.json')
+    if os.path.isfile(meta_filename):
+        with open(meta_filename) as f:
+            if json.load(f) == key:
+                return np.load(decay_filename, mmap_mode='r')
+        os.remove(meta_filename)
+    with profiling.span('decay_build', 'Computing edge decay'):
+        with np.load(points_file) as points:
+            decay = edge_decay(graph, points['ids'].tolist(), np.column_stack([points['x'], points['y']]), kind, radius)
+        np.save(decay_filename, decay)
+        with open(meta_filename, 'w') as f:
+            json.dump(key, f)
+    return np.load(decay_filename, mmap_mode='r')
+
+def load_graph(json_filename, cache_dir=None):
+    """Returns the CSR arrays for json_filename, memory-mapped read-only.
+
+    The cache is (re)built from the JSON file the first time and whenever
+    the file's contents change.
+    """
+    cache_dir = cache_dir or default_cache_dir(json_filename)
+    if not is_fresh(json_filename, cache_dir):
+        build_cache(json_filename, cache_dir)
+    return {name: np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r') for name in ARRAYS}
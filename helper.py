@@ -14,16 +14,11 @@ def change_in_longitude(latitude, miles):
     r = earth_radius*math.cos(latitude*degrees_to_radians)
     return (miles/r)*radians_to_degrees
 
-# def get_bounding_box(lat, lon):
-#     lat_change = change_in_latitude(50)
-#     long_change = change_in_longitude(lat, 50)
-#     return (lat-lat_change, lon-long_change, lat+lat_change, lon-long_change)
-
-# Function takes in a latitude, longitude and miles
-# to return an array of 
-# Top Left hand corner           Bottom right hand corner
-# [(new_long_min, new_lat_min), (new_long_max, new_lat_max)]
+# Function takes in a longitude, latitude and miles
+# to return the box around that point in rtree's
+# (left, bottom, right, top) coordinate order:
+# (new_long_min, new_lat_min, new_long_max, new_lat_max)
 def get_bounding_box(long, lat, miles=50):
     lat_change = change_in_latitude(miles)
     long_change = change_in_longitude(lat, miles)
-    return [(long-long_change, lat-lat_change), (long-long_change, lat+lat_change)]
\ No newline at end of file
+    return (long-long_change, lat-lat_change, long+long_change, lat+lat_change)
@@ -1,30 +1,68 @@
-import rtree
-import shapely
+import hashlib
+import json
+import os
 from rtree import index
 from helper import get_bounding_box
 
-def build(centroids, colleges):
-    centroid_index = index.Index()
-    college_index = index.Index()
-    for geo_id in centroids:
-        lat, lon = centroids[geo_id]
-        centroid_index.insert(geo_id, (lat, lon, lat, lon))
+# Points are (lat, lon) pairs keyed by id (geoID or university id). The
+# rtree stores them as x=lon, y=lat under their position in the id list
+# saved next to the index as <basename>.ids.json, along with a hash of
+# the points so a data refresh triggers a rebuild.
+
+def points_hash(points):
+    return hashlib.sha256(json.dumps([[point_id, list(points[point_id])] for point_id in points]).encode()).hexdigest()
+
+def build_index(points, basename=None):
+    ids = list(points.keys())
+    # Bulk load through rtree's stream constructor instead of one insert per point
+    stream = ((i, (points[point_id][1], points[point_id][0], points[point_id][1], points[point_id][0]), None) for i, point_id in enumerate(ids))
+    if basename is None:
+        return index.Index(stream), ids
+
+    # Disk-backed index in <basename>.dat / <basename>.idx (see http://toblerity.org/rtree/tutorial.html)
+    for ext in ('.dat', '.idx', '.ids.json'):
+        if os.path.isfile(basename + ext):
+            os.remove(basename + ext)
+    point_index = index.Index(basename, stream)
+    point_index.flush()
+    with open(basename + '.ids.json', 'w') as fp:
+        json.dump({'ids': ids, 'hash': points_hash(points)}, fp)
+    return point_index, ids
+
+def open_index(basename):
+    with open(basename + '.ids.json') as fp:
+        ids = json.load(fp)['ids']
+    return index.Index(basename), ids
+
+def load_index(points, basename):
+    # Reopen a stored index, building it the first time or when points change
+    if os.path.isfile(basename + '.ids.json'):
+        with open(basename + '.ids.json') as fp:
+            if json.load(fp)['hash'] == points_hash(points):
+                return open_index(basename)
+    return build_index(points, basename)
+
+def within_miles(point_index, ids, lat, lon, miles=50):
+    return [ids[i] for i in point_index.intersection(get_bounding_box(lon, lat, miles))]
+
+def build(centroids, colleges, basename='centroid_index', output_file='centroid_50_miles.json', miles=50):
+    centroid_index, centroid_ids = load_index(centroids, basename)
 
-    #store centroid index to file (see http://toblerity.org/rtree/tutorial.html)
-    
     centroid_50_miles = {}
 
     for geo_id in centroids:
         lat, lon = centroids[geo_id]
-        bb = get_bounding_box(lat, lon)
-        within_50_miles = list(centroid_index.intersection(bb))
+        within_50_miles = within_miles(centroid_index, centroid_ids, lat, lon, miles)
         centroid_50_miles[geo_id] = {'list': within_50_miles, 'edu_desert':1}
 
     for id in colleges:
         lat, lon = colleges[id]
-        bb = get_bounding_box(lat, lon)
-        within_50_miles = list(centroid_index.intersection(bb))
-        for geo_id in within_50_miles:
+        for geo_id in within_miles(centroid_index, centroid_ids, lat, lon, miles):
             centroid_50_miles[geo_id]['edu_desert'] = 0
 
-    #store centroid 50 mile dict to file
\ No newline at end of file
+    # Store centroid 50 mile dict to file
+    if output_file is not None:
+        with open(output_file, 'w') as fp:
+            json.dump(centroid_50_miles, fp)
+
+    return centroid_50_miles
@@ -1,7 +1,10 @@
-import csv
 import json
-import bisect
-import time
+import heapq
+import numpy as np
+import pandas as pd
+from graph_cache import csr_from_adjacency, load_graph
+import census_ingest
+import profiling
 
 class Node:
     def __init__(self, geo_id, val = 0):
@@ -25,12 +28,17 @@ class Node:
         return self.geo_id
 
     def get_total_value(self):
+        profiling.count('neighbors_touched', len(self.neighbors) + 1)
         val = self.value
         for neighbor in self.neighbors:
             val += neighbor.get_val()
         return val
 
 class Network:
+    # A list sort_single appends a copy of every re-evaluated entry to
+    # (for pick_log), or None
+    reevaluations = None
+
     def __init__(self):
         self.nodes = {}
         self.sorted_list = []
@@ -49,74 +57,353 @@ class Network:
                 self.add_node(Node(neighbor))
                 self.nodes[geo_id].add_neighbor(self.nodes[neighbor])
 
-    def get_val(self, arr):
-        return arr[1]
+    def keys(self):
+        return list(self.nodes.keys())
+
+    def get_geo_id(self, key):
+        return key
+
+    def get_key(self, geo_id):
+        return geo_id
+
+    def neighborhood(self, key):
+        # Keys of the tracts a site at key covers, itself included
+        return [key] + [neighbor.get_id() for neighbor in self.nodes[key].get_neighbors()]
+
+    def get_total_value(self, key):
+        return self.nodes[key].get_total_value()
+
+    def initial_values(self):
+        return [node.get_total_value() for node in self.nodes.values()]
+
+    def clear(self, key):
+        self.nodes[key].set_val(0.0)
+        for neighbor in self.nodes[key].get_neighbors():
+            neighbor.set_val(0.0)
 
     def initial_sort(self):
-        self.sorted_list = [[n_id, node.get_total_value()] for n_id, node in self.nodes.items()]
-        self.sorted_list.sort(key=self.get_val)
+        # Max-heap of [-value, order, key]; ties go to the node added
+        # last, as they did with the stable ascending sort this replaced
+        self.sorted_list = [[-val, -order, key] for order, (key, val) in enumerate(zip(self.keys(), self.initial_values()))]
+        heapq.heapify(self.sorted_list)
+        self.reinserted = 0
 
     def take(self):
-        node_id = self.sorted_list[-1][0]
-        val = self.nodes[node_id].get_total_value()
-        self.nodes[node_id].set_val(0.0)
-        for neighbor in self.nodes[node_id].get_neighbors():
-            neighbor.set_val(0.0)
-        return node_id, val
+        profiling.count('picks')
+        key = self.sorted_list[0][2]
+        val = self.get_total_value(key)
+        self.clear(key)
+        return self.get_geo_id(key), val
+
+    def reinsert(self, node_summary):
+        # A re-evaluated entry loses ties to everything already queued
+        self.reinserted += 1
+        node_summary[1] = self.reinserted
+        if self.reevaluations is not None:
+            self.reevaluations.append(node_summary[:])
+        heapq.heappush(self.sorted_list, node_summary)
 
     def sort_single(self):
-        node_summary = self.sorted_list[-1]
-        node_summary[1] = self.nodes[node_summary[0]].get_total_value()
-        self.sorted_list = self.sorted_list[:-1]
-        index = bisect.bisect_left([item[1] for item in self.sorted_list], node_summary[1])
-        self.sorted_list = self.sorted_list[:index] + [node_summary] + self.sorted_list[index:]
-        return self.sorted_list[-1][1]==node_summary[1]
-
-def read_network(json_filename, csv_file, census_file, compute_weight):
-    json_file = open(json_filename)
-    start = time.time()
-    nodes = json.load(json_file)
-    end = time.time()
-    print('Reading JSON took ' + str(end - start) + ' seconds')
+        # Only the top entry is re-evaluated; the rest keep their stale
+        # values. Those are upper bounds only while every weight is at least
+        # 0: a negative one (the salary metrics, where a tract earns more
+        # than the mean) goes back up to 0 once its tract is covered, so its
+        # neighbors gain, and the picks are then the lazy greedy's, as they
+        # always were, rather than the exact greedy's (DecayNetwork keeps
+        # real bounds instead)
+        profiling.count('reevaluations')
+        node_summary = heapq.heappop(self.sorted_list)
+        node_summary[0] = -self.get_total_value(node_summary[2])
+        self.reinsert(node_summary)
+        return self.sorted_list[0][0]==node_summary[0]
+
+    def next_best(self):
+        while(True):
+            if self.sort_single():
+                break
+
+class CSRNetwork(Network):
+    """Array-backed network for the dense tracts_in_buffer graphs.
+
+    Nodes are numbered 0..n-1 in the order Network would have created
+    them. Row i of the CSR arrays (indices[indptr[i]:indptr[i+1]]) holds
+    i itself followed by its neighbors in file order, so a neighborhood
+    sum is a single gather over `values`. `is_int` marks values that
+    Network would hold as Python ints, so totals print the same way.
+    """
+    def __init__(self, geo_ids, indptr, indices, values, is_int):
+        self.geo_ids = geo_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.values = values
+        self.is_int = is_int
+        self.index = {geo_id: i for i, geo_id in enumerate(geo_ids)}
+        self.sorted_list = []
+
+    @classmethod
+    def from_columns(cls, graph, weight_ids, weights, weights_int):
+        # Like Network, only keys of the JSON file pick up a weight
+        geo_ids = graph['geo_ids'].tolist()
+        index = {geo_id: i for i, geo_id in enumerate(geo_ids)}
+        rows = np.array([index.get(geo_id, -1) for geo_id in weight_ids], dtype=np.int64)
+        known = rows >= 0
+        values = np.zeros(len(geo_ids))
+        is_int = np.zeros(len(geo_ids), dtype=bool)
+        values[rows[known]] = weights[known]
+        is_int[rows[known]] = weights_int[known]
+        # Nodes that are neither keys nor weighted keep Network's defaults
+        values[~graph['is_key']] = 0.0
+        is_int[~graph['is_key']] = True
+        return cls(geo_ids, graph['indptr'], graph['indices'], values, is_int)
+
+    @classmethod
+    def from_arrays(cls, graph, weights):
+        weight_ids = list(weights.keys())
+        values = np.array([weights[geo_id] for geo_id in weight_ids], dtype=float)
+        weights_int = np.array([isinstance(weights[geo_id], int) for geo_id in weight_ids], dtype=bool)
+        return cls.from_columns(graph, weight_ids, values, weights_int)
+
+    @classmethod
+    def from_adjacency(cls, nodes, weights):
+        return cls.from_arrays(csr_from_adjacency(nodes), weights)
+
+    def has_node(self, geo_id):
+        return geo_id in self.index
+
+    def keys(self):
+        return range(len(self.geo_ids))
+
+    def get_geo_id(self, key):
+        return self.geo_ids[key]
+
+    def get_key(self, geo_id):
+        return self.index[geo_id]
+
+    def neighborhood(self, key):
+        return self.indices[self.indptr[key]:self.indptr[key+1]].tolist()
+
+    def get_total_value(self, key):
+        # cumsum adds left to right, matching Node.get_total_value bit for bit
+        row = self.indices[self.indptr[key]:self.indptr[key+1]]
+        profiling.count('neighbors_touched', len(row))
+        val = np.cumsum(self.values[row])[-1]
+        return int(val) if self.is_int[row].all() else float(val)
+
+    def initial_values(self):
+        # Add one neighbor position at a time across every row so each row
+        # is still summed left to right. Rows are ordered longest first so
+        # the rows still being summed are always a prefix.
+        lengths = np.diff(self.indptr)
+        order = np.argsort(-lengths, kind='stable')
+        starts = self.indptr[:-1][order]
+        active = np.searchsorted(-lengths[order], -np.arange(1, lengths.max() + 1), side='right') if len(order) else []
+        totals = np.zeros(len(order))
+        all_int = np.ones(len(order), dtype=bool)
+        for position, count in enumerate(active):
+            neighbors = self.indices[starts[:count] + position]
+            totals[:count] += self.values[neighbors]
+            all_int[:count] &= self.is_int[neighbors]
+        values = np.empty(len(order), dtype=object)
+        values[order] = [int(val) if is_int else float(val) for val, is_int in zip(totals, all_int)]
+        return values.tolist()
+
+    def clear(self, key):
+        row = self.indices[self.indptr[key]:self.indptr[key+1]]
+        self.values[row] = 0.0
+        self.is_int[row] = False
+
+class DecayNetwork(CSRNetwork):
+    """CSRNetwork where a site covers each tract in its buffer only in part.
+
+    decay holds one factor in [0, 1] per CSR entry (see
+    graph_cache.load_decay): the share of the entry's remaining value a
+    site at the row's tract captures. Taking a site keeps the rest, so
+    a tract can be covered bit by bit by several sites; with every
+    factor 1 this is CSRNetwork.
+
+    A tract of negative weight keeps going up towards 0 as sites around it
+    are taken, so a site's value can go up too, and a stale value is not
+    an upper bound. Entries are therefore queued at a bound instead, what
+    the site captures of its positive tracts alone (see value_bound), and
+    next_best re-evaluates them until the best value found beats every
+    bound left. Where a site has no negative tracts the bound is its
+    value, and next_best does what Network's does.
+    """
+    def __init__(self, geo_ids, indptr, indices, values, is_int, decay):
+        super().__init__(geo_ids, indptr, indices, values, is_int)
+        self.decay = decay
+        self.pending = []
+        self.top_exact = True
+
+    @classmethod
+    def from_network(cls, network, decay):
+        return cls(network.geo_ids, network.indptr, network.indices, network.values, network.is_int, decay)
+
+    def get_total_value(self, key):
+        start, end = self.indptr[key], self.indptr[key+1]
+        profiling.count('neighbors_touched', end - start)
+        return float(np.dot(self.values[self.indices[start:end]], self.decay[start:end]))
+
+    def initial_values(self):
+        return np.add.reduceat(self.values[self.indices] * self.decay, self.indptr[:-1]).tolist()
+
+    def value_bound(self, key):
+        # The value of a site at key, and a bound on any value it can have
+        # later: negative tracts only go up to 0 and positive ones down
+        start, end = self.indptr[key], self.indptr[key+1]
+        values = self.values[self.indices[start:end]]
+        value = self.get_total_value(key)
+        captured = values * self.decay[start:end]
+        if (captured >= 0).all():
+            return value, value
+        return value, max(value, float(captured[captured > 0].sum()))
+
+    def initial_sort(self):
+        # Queued at their bounds; where one is above its value the top is
+        # not known to be the best until next_best has run (see take)
+        values = self.initial_values()
+        starts = self.indptr[:-1]
+        captured = self.values[self.indices] * self.decay
+        negative = np.logical_or.reduceat(captured < 0, starts)
+        bounds = np.maximum(np.add.reduceat(np.maximum(captured, 0), starts), values)
+        self.sorted_list = [[-(bound if has_negative else val), -order, key] for order, (key, val, bound, has_negative) in enumerate(zip(self.keys(), values, bounds.tolist(), negative.tolist()))]
+        heapq.heapify(self.sorted_list)
+        self.reinserted = 0
+        self.pending = []
+        self.top_exact = not negative.any()
+
+    def next_best(self):
+        # Entries below their bounds are set aside at their values rather
+        # than put back, until the best of them beats every entry left
+        # (which is then taken) or the top entry is re-evaluated in place
+        # as in Network.sort_single. take puts them back at their bounds.
+        best = None
+        while True:
+            profiling.count('reevaluations')
+            node_summary = heapq.heappop(self.sorted_list)
+            value, bound = self.value_bound(node_summary[2])
+            node_summary[0] = -value
+            if bound > value:
+                self.pending.append([node_summary, bound])
+                if best is None or value > -best[0]:
+                    best = node_summary
+                done = False
+            else:
+                self.reinsert(node_summary)
+                done = self.sorted_list[0][0] == node_summary[0] and (best is None or value >= -best[0])
+            if best is not None and (not self.sorted_list or -best[0] > -self.sorted_list[0][0]):
+                self.pending = [entry for entry in self.pending if entry[0] is not best]
+                self.reinsert(best)
+                done = True
+            if done:
+                break
+        self.top_exact = True
+
+    def take(self):
+        if not self.top_exact:
+            self.next_best()
+        key = self.sorted_list[0][2]
+        value, bound = self.value_bound(key)
+        taken = super().take()
+        # Clearing can raise what the taken site and those set aside are
+        # worth, so they are queued at their bounds again
+        if bound > value:
+            node_summary = heapq.heappop(self.sorted_list)
+            node_summary[0] = -self.value_bound(key)[1]
+            self.reinsert(node_summary)
+        for node_summary, bound in self.pending:
+            node_summary[0] = -bound
+            self.reinsert(node_summary)
+        self.pending = []
+        return taken
+
+    def clear(self, key):
+        start, end = self.indptr[key], self.indptr[key+1]
+        self.values[self.indices[start:end]] *= 1 - self.decay[start:end].astype(float)
+
+# Census columns read_columns needs out of the (very wide) features file
+MEDIAN_INCOME = 'Median Household Income (In 2017 Inflation Adjusted Dollars)'
+HOUSEHOLDS = 'Households:.3'
+LABOR_FORCE = 'Population 16 Years and Over: in Labor Force'
+TOTAL_POP = 'Total Population:'
+DEGREE_PCTS = ['Pct. Population 25 Years and Over: Bachelor\'s Degree', 'Pct. Population 25 Years and Over: Master\'s Degree', 'Pct. Population 25 Years and Over: Professional School Degree', 'Pct. Population 25 Years and Over: Doctorate Degree']
+FEATURE_COLUMNS = [TOTAL_POP, MEDIAN_INCOME, HOUSEHOLDS, LABOR_FORCE] + DEGREE_PCTS
+
+def read_float_columns(filename, columns, cached=False):
+    # round_trip parses floats exactly as float() does. Rows that fail to
+    # parse or have blanks are reported by geoID rather than zeroed.
+    if cached:
+        df = census_ingest.read_cached(filename, ['geoID'] + columns, dtype={'geoID': str})
+        df[columns] = df[columns].apply(pd.to_numeric, errors='coerce').astype(float)
+    else:
+        dtypes = dict({'geoID': str}, **{column: float for column in columns})
+        try:
+            df = pd.read_csv(filename, usecols=['geoID'] + columns, dtype=dtypes, float_precision='round_trip')
+        except ValueError:
+            df = pd.read_csv(filename, usecols=['geoID'] + columns, dtype=str)
+            df[columns] = df[columns].apply(pd.to_numeric, errors='coerce')
+    bad = df[df[columns].isna().any(axis=1)]
+    if len(bad) > 0:
+        raise ValueError('{}: {} rows with missing or malformed values in {}, e.g. geoIDs {}'.format(
+            filename, len(bad), [column for column in columns if bad[column].isna().any()], bad['geoID'].tolist()[:10]))
+    return df.drop_duplicates('geoID', keep='last')
+
+def read_columns(csv_file, census_file, cache_census=False):
+    """Reads the prediction and census files into NumPy columns.
+
+    Returns a dict of geo_ids, pop, salary, pct and pct_pred, with one
+    entry per row of the prediction file. With cache_census, the census
+    columns come from census_ingest's columnar cache.
+    """
+    with profiling.span('features_csv', 'Reading features CSV'):
+        features = read_float_columns(census_file, FEATURE_COLUMNS, cache_census)
+        working_pop = features[LABOR_FORCE].values
+        median_income = features[MEDIAN_INCOME].values
+        features['salary'] = np.divide(median_income*features[HOUSEHOLDS].values, working_pop, out=median_income.copy(), where=working_pop > 0)
+        features['pct'] = ((features[DEGREE_PCTS[0]] + features[DEGREE_PCTS[1]]) + features[DEGREE_PCTS[2]]) + features[DEGREE_PCTS[3]]
+
+    with profiling.span('weights_csv', 'Reading weights CSV'):
+        predictions = read_float_columns(csv_file, ['pred_pct_bachelors'])
+        pct_pred = predictions['pred_pct_bachelors']
+        rows = features.set_index('geoID').reindex(predictions['geoID'])
+        if rows['pct'].isna().any():
+            missing = predictions['geoID'][rows['pct'].isna().values]
+            raise ValueError('{}: {} predicted tracts missing from {}, e.g. {}'.format(
+                csv_file, len(missing), census_file, missing.tolist()[:10]))
+
+    columns = {'geo_ids': predictions['geoID'].tolist(), 'pop': rows[TOTAL_POP].values, 'salary': rows['salary'].values, 'pct': rows['pct'].values, 'pct_pred': pct_pred.values}
+    higher = dict(zip(columns['geo_ids'], columns['pct_pred'] > columns['pct']))
+    print('Percent predictions higher than original: '+str(sum(higher.values())/len(higher)))
+    return columns
+
+def read_weights(csv_file, census_file, compute_weight, cache_census=False):
+    # compute_weight for every predicted tract, keyed by geoID
+    columns = read_columns(csv_file, census_file, cache_census)
     weights = {}
-    net = Network()
-    features = {}
-    
-    start = time.time()
-    with open(census_file) as featuresfile:
-        featuresreader = csv.DictReader(featuresfile, delimiter=',')
-        for row in featuresreader:
-            working_pop = float(row['Population 16 Years and Over: in Labor Force'])
-            salary = (float(row['Median Household Income (In 2017 Inflation Adjusted Dollars)'])*float(row['Households:.3']))/float(row['Population 16 Years and Over: in Labor Force']) if working_pop > 0 else float(row['Median Household Income (In 2017 Inflation Adjusted Dollars)'])
-            pct_total_college_grads = float(row['Pct. Population 25 Years and Over: Bachelor\'s Degree'])+float(row['Pct. Population 25 Years and Over: Master\'s Degree'])+float(row['Pct. Population 25 Years and Over: Professional School Degree'])+float(row['Pct. Population 25 Years and Over: Doctorate Degree'])
-            features[row['geoID']] = [float(row['Total Population:']), salary, pct_total_college_grads]
-    end = time.time()
-    print('Reading features CSV took ' + str(end - start) + ' seconds')
-
-    start = time.time()
-    num = 0
-    with open(csv_file) as weightfile:
-        weightreader = csv.DictReader(weightfile, delimiter=',')
-        for row in weightreader:
-            pop, salary, pct = features[row['geoID']]
-            try:
-                weights[row['geoID']] = compute_weight(pop, salary, pct, float(row['pred_pct_bachelors']))
-                if float(row['pred_pct_bachelors']) > pct:
-                    num+=1
-            except:
-                weights[row['geoID']] = compute_weight(pop, salary, pct, 0.0)
-    end = time.time()
-    print('Reading weights CSV took ' + str(end - start) + ' seconds')
-    print('Percent predictions higher than original: '+str(num/len(weights.keys())))
-
-    start = time.time()
-    for key in nodes.keys():
-        if net.has_node(key):
-            net.nodes[key].set_val(weights[key] if key in weights else 0.0)
-        else:
-            net.add_node(Node(key, weights[key] if key in weights else 0.0))
-        net.add_neighbors(key, nodes[key])
-    end = time.time()
-    print('Building graph took ' + str(end - start) + ' seconds')
+    for geo_id, pop, salary, pct, pct_pred in zip(columns['geo_ids'], columns['pop'].tolist(), columns['salary'].tolist(), columns['pct'].tolist(), columns['pct_pred'].tolist()):
+        weights[geo_id] = compute_weight(pop, salary, pct, pct_pred)
+    return weights
+
+def read_network(json_filename, csv_file, census_file, compute_weight, compact=False, cache_dir=None, cache_census=False):
+    weights = read_weights(csv_file, census_file, compute_weight, cache_census)
+
+    if compact:
+        # The compact graph comes straight from the binary cache
+        with profiling.span('graph_load', 'Loading graph'):
+            net = CSRNetwork.from_arrays(load_graph(json_filename, cache_dir), weights)
+        return net
+
+    json_file = open(json_filename)
+    with profiling.span('json_load', 'Reading JSON'):
+        nodes = json.load(json_file)
+
+    with profiling.span('graph_build', 'Building graph'):
+        net = Network()
+        for key in nodes.keys():
+            if net.has_node(key):
+                net.nodes[key].set_val(weights[key] if key in weights else 0.0)
+            else:
+                net.add_node(Node(key, weights[key] if key in weights else 0.0))
+            net.add_neighbors(key, nodes[key])
 
     return net
\ No newline at end of file
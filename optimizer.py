@@ -1,5 +1,15 @@
-from network_reader import read_network
-import time
+from network_reader import read_network, read_columns, read_weights, CSRNetwork, DecayNetwork
+from graph_cache import graph_sha256, load_graph, load_decay, shards, subgraph
+from multiprocessing import Pool, cpu_count
+import heapq
+import itertools
+import os
+import exact_solver
+import pick_log
+import spatial_greedy
+import uncertainty
+import profiling
+import numpy as np
 
 def compute_added_average_salary(_, salary, pct, pct_pred):
     if pct_pred < 0:
@@ -25,33 +35,482 @@ def compute_num_census_tracts(pop, salary, pct, pct_pred):
 def compute_total_pop(pop, salary, pct, pct_pred):
     return pop
 
-def top_k_locations(graph_file, prediction_file, census_file, k, compute_weight):
-    start = time.time()
-    network = read_network(graph_file, prediction_file, census_file, compute_weight)
-    end = time.time()
-    print('Reading network took ' + str(end - start) + ' seconds')
-    start = time.time()
+# Column versions of the metrics above, used by top_k_all. Each returns
+# the weights and a mask of those the scalar version returns as an int.
+def added_diff(pct, pct_pred):
+    return np.where(pct_pred - pct > 0, pct_pred - pct, 0.0)
+
+def added_average_salary_columns(pop, salary, pct, pct_pred):
+    diff = added_diff(pct, pct_pred)
+    return np.where(pct_pred < 0, 0.0, (salary*(1-diff) + 50516*diff) - salary), pct_pred < 0
+
+def added_total_salary_columns(pop, salary, pct, pct_pred):
+    diff = added_diff(pct, pct_pred)
+    return np.where(pct_pred < 0, 0.0, (salary*(1-diff)*pop + 50516*diff*pop) - salary*pop), pct_pred < 0
+
+def num_added_grads_columns(pop, salary, pct, pct_pred):
+    diff = added_diff(pct, pct_pred)
+    return np.where(pct_pred < 0, 0.0, diff*pop), pct_pred < 0
+
+def num_census_tracts_columns(pop, salary, pct, pct_pred):
+    return np.ones(len(pop)), np.ones(len(pop), dtype=bool)
+
+def total_pop_columns(pop, salary, pct, pct_pred):
+    return pop.copy(), np.zeros(len(pop), dtype=bool)
+
+# Batch outputs written by top_k_all, as output_<name>.txt
+METRICS = {
+    'avg_added_salary': added_average_salary_columns,
+    'total_added_salary': added_total_salary_columns,
+    'num_added_grads': num_added_grads_columns,
+    'total_pop': total_pop_columns,
+}
+
+def run_record(method, compute_weight, k, files, graph_file=None, cache_dir=None, **options):
+    # What a run's picks depend on, as its results file records it: the
+    # size and mtime of files, and the sha256 of the graph, which is free
+    # once its cache is fresh
+    inputs = {}
+    for name, filename in files.items():
+        stat = os.stat(filename)
+        inputs[name] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if graph_file:
+        inputs['graph'] = graph_sha256(graph_file, cache_dir)
+    return dict({'method': method, 'metric': compute_weight.__name__, 'k': k, 'inputs': inputs}, **options)
+
+def run_files(run, results_file=None, output_file=None):
+    # Where a run streams its picks and writes them as text: by default a
+    # pair of files of its own in pick_log.RUNS_DIR, so concurrent runs
+    # never share one, and the text goes next to the picks
+    if not results_file:
+        results_file = pick_log.run_filename(run)
+    output_file = output_file or os.path.splitext(results_file)[0] + '.txt'
+    print('Writing picks to ' + results_file + ' and ' + output_file)
+    return results_file, output_file
+
+def top_k_locations(graph_file, prediction_file, census_file, k, compute_weight, compact=False, cache_dir=None, cache_census=False, profile_file=None, results_file=None, output_file=None):
+    """Greedily picks k sites, writing them with their values to output_file.
+
+    With profile_file, the spans and counters of the run (see
+    profiling.py) are written there as JSON. Every pick is also streamed
+    as it is made (see pick_log.PickWriter) to results_file (.csv or
+    .jsonl). By default both are new files in pick_log.RUNS_DIR named
+    after the metric, k, the time and the process id (see
+    pick_log.run_filename), so concurrent runs never share one; an
+    output_file not given goes next to results_file, as .txt. If
+    results_file already holds picks from an interrupted run of the same
+    metric, k and inputs, those are replayed and the run carries on after
+    them, picking what it would have.
+    """
+    if profile_file:
+        profiling.enable()
+    with profiling.span('read_network', 'Reading network'):
+        network = read_network(graph_file, prediction_file, census_file, compute_weight, compact, cache_dir, cache_census)
+    run = run_record('top_k_locations', compute_weight, k, {'prediction': prediction_file, 'census': census_file}, graph_file, cache_dir)
+    results_file, output_file = run_files(run, results_file, output_file)
+    outtext = run_greedy(network, k, pick_log.PickWriter(results_file, run))
+    with open(output_file, "w+") as f:
+        f.write(outtext)
+    if profile_file:
+        profiling.write(profiling.disable(), profile_file)
+
+def greedy(network, k, writer=None, picks=()):
+    # picks (geoID, value) were taken already and the heap must be as
+    # they left it (see restore); a writer records the picks after them
+    # with the entries re-evaluated before each
+    lines = [geo_id + ": " + str(value) for geo_id, value in picks[:k]]
+    if writer is not None:
+        network.reevaluations = []
+    for i in range(len(lines), k):
+        with profiling.span('pick'):
+            if i > 0:
+                network.next_best()
+            top, value = network.take()
+        lines.append(top + ": " + str(value))
+        if writer is not None:
+            reevaluated = [[network.get_geo_id(key), -stored, tiebreak] for stored, tiebreak, key in network.reevaluations]
+            writer.add(top, value, network.neighborhood(network.get_key(top)), reevaluated)
+            network.reevaluations = []
+    network.reevaluations = None
+    return "\n".join(lines)
+
+def restore(network, reevaluated, picks):
+    # Brings the heap to where greedy left it after the given
+    # re-evaluations ([geoID, value, tiebreak], in order) and picks
+    # (geoIDs): sorted on the initial values, with the re-evaluated
+    # entries put back, tiebreaks included, and the picks' tracts cleared
     network.initial_sort()
-    end = time.time()
-    print('Initial sort took ' + str(end - start) + ' seconds')
-    outtext = ""
-    for i in range(k-1):
-        start = time.time()
-        top, value = network.take()
-        outtext += top + ": " + str(value) + "\n"
-        while(True):
-            if network.sort_single():
+    entries = {entry[2]: entry for entry in network.sorted_list}
+    for geo_id, value, tiebreak in reevaluated:
+        entry = entries[network.get_key(geo_id)]
+        entry[0] = -value
+        entry[1] = tiebreak
+        network.reinserted = tiebreak
+    for geo_id in picks:
+        network.clear(network.get_key(geo_id))
+    heapq.heapify(network.sorted_list)
+
+def replay(network, writer):
+    # Brings the heap to where an interrupted run left it
+    restore(network, [entry for pick in writer.picks for entry in pick['reevaluated']], [pick['geoID'] for pick in writer.picks])
+    for pick in writer.picks:
+        writer.covered.update(network.neighborhood(network.get_key(pick['geoID'])))
+
+def run_greedy(network, k, writer):
+    # Initial sort (or replay) and greedy for top_k_locations and top_k_decay
+    with writer:
+        if writer.picks:
+            with profiling.span('replay', 'Replaying ' + str(len(writer.picks)) + ' picks'):
+                replay(network, writer)
+        else:
+            with profiling.span('initial_sort', 'Initial sort'):
+                network.initial_sort()
+        with profiling.span('greedy', 'Greedy'):
+            return greedy(network, k, writer, [(pick['geoID'], pick['gain']) for pick in writer.picks])
+
+def top_k_decay(graph_file, points_file, prediction_file, census_file, k, compute_weight, kind='linear', radius=40233.6, cache_dir=None, cache_census=False, results_file=None, output_file=None):
+    """top_k_locations with partial, distance-decayed coverage.
+
+    A site captures only a share of each neighbor's remaining value,
+    falling with distance as graph_cache.DECAY[kind] says; points_file
+    holds the projected tract points the distances come from. Writes
+    output_file and streams its picks to results_file (by default files
+    of its own) like top_k_locations; a tract counts as covered once any
+    pick has its buffer.
+    """
+    with profiling.span('read_network', 'Reading network'):
+        network = read_network(graph_file, prediction_file, census_file, compute_weight, True, cache_dir, cache_census)
+        network = DecayNetwork.from_network(network, load_decay(graph_file, points_file, kind, radius, cache_dir))
+    run = run_record('top_k_decay', compute_weight, k, {'points': points_file, 'prediction': prediction_file, 'census': census_file}, graph_file, cache_dir, kind=kind, radius=radius)
+    results_file, output_file = run_files(run, results_file, output_file)
+    outtext = run_greedy(network, k, pick_log.PickWriter(results_file, run))
+    with open(output_file, "w+") as f:
+        f.write(outtext)
+
+def top_k_exact(graph_file, prediction_file, census_file, k, compute_weight, time_limit=60, cache_dir=None, cache_census=False):
+    """Solves the problem top_k_locations solves greedily exactly, and reports the greedy gap.
+
+    Writes the (at most k) sites of the best answer found to
+    output_exact.txt, each with the value it adds taken in that order,
+    and returns exact_solver.solve's summary. time_limit (seconds) bounds
+    the whole solve; see exact_solver.solve.
+    """
+    network = read_network(graph_file, prediction_file, census_file, compute_weight, True, cache_dir, cache_census)
+    with profiling.span('exact_solve', 'Exact solve'):
+        result = exact_solver.solve(network, k, time_limit)
+    print('Best value: ' + str(result['value']) + (' (optimal)' if result['proven'] else ' (upper bound ' + str(result['upper_bound']) + ')'))
+    print('Greedy value: ' + str(result['greedy_value']) + ', at most ' + str(100*result['gap']) + '% below optimal')
+    lines = []
+    for geo_id in result['sites']:
+        lines.append(geo_id + ": " + str(network.get_total_value(network.index[geo_id])))
+        network.clear(network.index[geo_id])
+    with open('output_exact.txt', 'w+') as f:
+        f.write("\n".join(lines))
+    return result
+
+# Graph shared by top_k_all's worker processes
+batch_graph = None
+
+def init_batch_worker(graph_file, cache_dir):
+    global batch_graph
+    batch_graph = load_graph(graph_file, cache_dir)
+
+def run_batch_metric(args):
+    name, weight_ids, weights, weights_int, k, output_dir = args
+    network = CSRNetwork.from_columns(batch_graph, weight_ids, weights, weights_int)
+    network.initial_sort()
+    outtext = greedy(network, k)
+    with open(os.path.join(output_dir, 'output_' + name + '.txt'), 'w+') as f:
+        f.write(outtext)
+    return name
+
+def top_k_all(graph_file, prediction_file, census_file, k, metrics=METRICS, output_dir='', processes=None, cache_dir=None, cache_census=False):
+    """Runs top_k_locations for every metric while loading the inputs once.
+
+    The census and prediction files are read a single time and each
+    metric's weights are computed over whole columns. The greedy runs for
+    the metrics are spread over a process pool, with every worker
+    memory-mapping the same cached graph.
+    """
+    with profiling.span('read_inputs', 'Reading inputs'):
+        columns = read_columns(prediction_file, census_file, cache_census)
+        load_graph(graph_file, cache_dir)
+    tasks = []
+    for name, compute_columns in metrics.items():
+        weights, weights_int = compute_columns(columns['pop'], columns['salary'], columns['pct'], columns['pct_pred'])
+        tasks.append((name, columns['geo_ids'], weights, weights_int, k, output_dir))
+    with Pool(min(processes or len(tasks), len(tasks)), init_batch_worker, (graph_file, cache_dir)) as pool:
+        for name in pool.imap_unordered(run_batch_metric, tasks):
+            print('Wrote output_' + name + '.txt')
+
+
+# Weights shared by top_k_sharded's and top_k_monte_carlo's worker
+# processes: weight_ids, then the weights and int masks, as vectors or
+# one row per sample
+worker_weights = None
+
+def init_weights_worker(graph_file, cache_dir, weight_ids, weights, weights_int):
+    global batch_graph, worker_weights
+    batch_graph = load_graph(graph_file, cache_dir)
+    worker_weights = (weight_ids, weights, weights_int)
+
+def shard_greedy(network, k, others):
+    """k greedy picks within one shard, re-evaluating as top_k_locations' single heap would.
+
+    Clearing a tract of negative value raises its neighbors' values, so
+    the single heap does not pop the shards' entries in any fixed order:
+    it always pops whichever shard's top is best. others holds the other
+    shards' pops (negated values, in order) from an earlier run, which
+    are merged with this shard's as the single heap would interleave
+    them. Where this shard's heap would stop re-evaluating and take its
+    top, the single heap only does so if no other shard's next pop comes
+    first; otherwise it pops that, and this shard carries on re-evaluating
+    after it. Returns the picks (geoID, value), the negated value of every
+    pop, for every pop whether this shard's heap alone would stop there,
+    its top's negated value and whether it stopped, and the geoID and new
+    value of every entry re-evaluated.
+    """
+    network.reevaluations = []
+    heads = [(stream[0], j, 0) for j, stream in enumerate(others) if len(stream)]
+    heapq.heapify(heads)
+    pops = []
+    checks = []
+    picks = []
+    for i in range(k):
+        while True:
+            popped = network.sorted_list[0][0]
+            # Other shards' pops that come before this one
+            while heads and heads[0][0] < popped:
+                _, j, position = heapq.heappop(heads)
+                if position + 1 < len(others[j]):
+                    heapq.heappush(heads, (others[j][position + 1], j, position + 1))
+            pops.append(popped)
+            alone = network.sort_single()
+            top = network.sorted_list[0][0]
+            stop = alone and not (heads and heads[0][0] < top)
+            checks.append((alone, top, stop))
+            if stop:
                 break
-        end = time.time()
-        print("Iteration " + str(i) + " took " + str(end-start) + " seconds")
-    start = time.time()
-    top, value = network.take()
-    end = time.time()
-    print("Iteration " + str(k) + " took " + str(end-start) + " seconds")
-    outtext += top + ": " + str(value)
-    f = open("output.txt", "w+")
-    f.write(outtext)
-    f.close()
+        picks.append(network.take())
+    return picks, pops, checks, [(network.get_geo_id(key), -stored) for stored, _, key in network.reevaluations]
+
+def run_shard(args):
+    # shard_greedy within one shard
+    nodes, k, others = args
+    network = CSRNetwork.from_columns(subgraph(batch_graph, nodes), *worker_weights)
+    network.initial_sort()
+    return shard_greedy(network, k, others)
+
+def merge_shards(results, k):
+    """Interleaves the shards' runs as top_k_locations' single heap would, up to its k-th pick.
+
+    Returns the picks, the shards whose stops disagree with the other
+    shards' pops, whether two shards' pops tie exactly (the single heap
+    would then order them by when their entries were last re-evaluated,
+    which no shard knows) and, if either happens, the single heap's
+    re-evaluations ([geoID, value, tiebreak], see restore) and picks up
+    to the first time it does, which are exact.
+    """
+    heads = [(result[1][0], i, 0) for i, result in enumerate(results) if result[1]]
+    heapq.heapify(heads)
+    taken = [0] * len(results)
+    picks = []
+    stale = set()
+    reevaluated = []
+    prefix = None
+    for pops in itertools.count():
+        if not heads or len(picks) == k:
+            return picks, stale, False, prefix
+        popped, i, position = heapq.heappop(heads)
+        if heads and heads[0][0] == popped:
+            return picks, stale, True, prefix or (reevaluated, picks)
+        if position + 1 < len(results[i][1]):
+            heapq.heappush(heads, (results[i][1][position + 1], i, position + 1))
+        alone, top, stop = results[i][2][position]
+        if alone:
+            # The best pop of any other shard still to come
+            other = min((head for head in heads[:3] if head[1] != i), default=None)
+            if other is not None and other[0] == top:
+                return picks, stale, True, prefix or (reevaluated, picks)
+            if stop != (other is None or other[0] > top):
+                stale.add(i)
+                prefix = prefix or (reevaluated[:], picks[:])
+        # The single heap takes the first pick without re-evaluating it
+        if pops > 0:
+            reevaluated.append(list(results[i][3][position]) + [pops])
+        if stop and i not in stale:
+            picks.append(results[i][0][taken[i]])
+            taken[i] += 1
+
+def tie_prone(network, groups, k):
+    """Whether top_k_sharded's shards (groups of nodes) would likely tie exactly, so greedy had better run whole.
+
+    Sums of integer weights (as compute_total_pop's) tie all the time,
+    and so do the zero values greedy reaches once fewer than k sites have
+    a positive value. Positive values only tie across shards by chance,
+    but then they are known to. The best site must not tie at all: its
+    shard re-evaluates it before the first pick, which the single heap
+    skips, and that only leaves the pick alone if no site ties it.
+    """
+    if (network.is_int & (network.values != 0)).any():
+        return True
+    initial = np.array(network.initial_values(), dtype=float)
+    positive = np.flatnonzero(initial > 0)
+    if len(positive) < k:
+        return True
+    shard_of = np.empty(len(initial), dtype=np.int64)
+    for i, nodes in enumerate(groups):
+        shard_of[nodes] = i
+    order = positive[np.argsort(initial[positive], kind='stable')]
+    ties = initial[order][1:] == initial[order][:-1]
+    return bool(ties[-1] or (ties & (shard_of[order][1:] != shard_of[order][:-1])).any())
+
+def top_k_sharded(graph_file, prediction_file, census_file, k, compute_weight, processes=None, cache_dir=None, cache_census=False, max_rounds=10, results_file=None, output_file=None):
+    """top_k_locations with the graph split into independent shards run in parallel.
+
+    Picks in one connected component of the graph never change values in
+    another, so greedy runs for k picks in each shard (a group of
+    components, see graph_cache.shards) over a process pool. Interleaving
+    the shards' heap pops as top_k_locations' single heap would (see
+    merge_shards) gives its pick sequence, as long as every shard stopped
+    re-evaluating where the single heap would have. That depends on the
+    other shards' pops (see shard_greedy), so shards that stopped
+    differently are rerun against them until none do. Weights likely to
+    tie exactly (see tie_prone) skip the shards and run greedy over the
+    whole graph at once. If settling takes more than max_rounds reruns,
+    or two shards' pops tie after all, greedy over the whole graph takes
+    over from the last point the shards' runs are known to be exact at
+    (see restore). Writes output_file like top_k_locations, and the picks
+    to results_file (by default files of its own) once they are all
+    known; an existing results_file is written over, not resumed.
+    """
+    with profiling.span('read_inputs', 'Reading inputs'):
+        weights = read_weights(prediction_file, census_file, compute_weight, cache_census)
+        graph = load_graph(graph_file, cache_dir)
+        weight_ids = list(weights.keys())
+        values = np.array([weights[geo_id] for geo_id in weight_ids], dtype=float)
+        weights_int = np.array([isinstance(weights[geo_id], int) for geo_id in weight_ids], dtype=bool)
+        network = CSRNetwork.from_columns(graph, weight_ids, values, weights_int)
+    run = run_record('top_k_sharded', compute_weight, k, {'prediction': prediction_file, 'census': census_file}, graph_file, cache_dir)
+    processes = processes or cpu_count()
+    with profiling.span('sharding', 'Sharding graph'):
+        # A few shards per process evens out components of different sizes
+        groups = shards(graph, 4*processes)
+    print('Split graph into ' + str(len(groups)) + ' shards')
+    picks = None
+    prefix = ([], [])
+    if tie_prone(network, groups, k):
+        print('Shards are likely to tie exactly, running greedy on the whole graph')
+    else:
+        with profiling.span('shard_greedy', 'Shard greedy'):
+            with Pool(min(processes, len(groups)), init_weights_worker, (graph_file, cache_dir, weight_ids, values, weights_int)) as pool:
+                results = pool.map(run_shard, [(nodes, k, []) for nodes in groups])
+                for rounds in range(max_rounds + 1):
+                    merged, stale, tied, prefix = merge_shards(results, k)
+                    if tied:
+                        print('Shards tie exactly after ' + str(len(prefix[1])) + ' picks, running greedy on the whole graph from there')
+                        break
+                    if not stale:
+                        picks = merged
+                        break
+                    if rounds == max_rounds:
+                        print('Shards did not settle in ' + str(max_rounds) + ' rounds, running greedy on the whole graph after ' + str(len(prefix[1])) + ' picks')
+                        break
+                    stale = sorted(stale)
+                    profiling.count('shard_reruns', len(stale))
+                    tasks = [(groups[i], k, [results[j][1] for j in range(len(results)) if j != i]) for i in stale]
+                    for i, result in zip(stale, pool.map(run_shard, tasks)):
+                        results[i] = result
+    results_file, output_file = run_files(run, results_file, output_file)
+    with pick_log.PickWriter(results_file, run, resume=False) as writer:
+        if picks is None:
+            reevaluated, done = prefix
+            with profiling.span('greedy', 'Greedy'):
+                restore(network, reevaluated, [top for top, _ in done])
+                for top, value in done:
+                    writer.add(top, value, network.neighborhood(network.get_key(top)))
+                outtext = greedy(network, k, writer, done)
+        else:
+            for top, value in picks:
+                writer.add(top, value, network.neighborhood(network.get_key(top)))
+            outtext = "\n".join(top + ": " + str(value) for top, value in picks)
+    with open(output_file, "w+") as f:
+        f.write(outtext)
+
+
+def run_sample(args):
+    # geoIDs of the greedy picks for one row of the weight matrix
+    sample, k = args
+    weight_ids, weights, weights_int = worker_weights
+    network = CSRNetwork.from_columns(batch_graph, weight_ids, weights[sample], weights_int[sample])
+    network.initial_sort()
+    picks = []
+    for i in range(k):
+        if i > 0:
+            network.next_best()
+        picks.append(network.take()[0])
+    return sample, picks
+
+def top_k_monte_carlo(graph_file, prediction_file, census_file, k, compute_columns, samples, output_file='selection_uncertainty.csv', level=0.9, processes=None, cache_dir=None, cache_census=False):
+    """How stable top_k_locations' picks are under prediction noise.
+
+    samples is a (draws, rows) matrix of pred_pct_bachelors draws, one
+    column per row of the prediction file (see uncertainty.tree_samples
+    and uncertainty.residual_samples). compute_columns, one of METRICS'
+    values, turns the whole matrix into weights at once; greedy then
+    runs for every draw, and for the file's own predictions, over a
+    process pool whose workers share one memory-mapped graph. Writes
+    uncertainty.summarize's per-tract selection frequency and rank
+    interval to output_file and returns it.
+    """
+    with profiling.span('read_inputs', 'Reading inputs'):
+        columns = read_columns(prediction_file, census_file, cache_census)
+        load_graph(graph_file, cache_dir)
+    samples = np.asarray(samples, dtype=float)
+    if samples.ndim != 2 or samples.shape[1] != len(columns['geo_ids']):
+        raise ValueError('samples must have one column per prediction ({}), got shape {}'.format(len(columns['geo_ids']), samples.shape))
+    with profiling.span('sample_weights', 'Computing sample weights'):
+        # Row 0 is the point prediction, the rest the draws
+        pct_pred = np.vstack([columns['pct_pred'], samples])
+        weights, weights_int = compute_columns(columns['pop'], columns['salary'], columns['pct'], pct_pred)
+        weights = np.broadcast_to(weights, pct_pred.shape)
+        weights_int = np.broadcast_to(weights_int, pct_pred.shape)
+    picks = [None] * len(pct_pred)
+    with profiling.span('sample_greedy', 'Greedy over samples'):
+        with Pool(processes, init_weights_worker, (graph_file, cache_dir, columns['geo_ids'], weights, weights_int)) as pool:
+            for sample, sample_picks in pool.imap_unordered(run_sample, [(sample, k) for sample in range(len(pct_pred))]):
+                picks[sample] = sample_picks
+    summary = uncertainty.summarize(picks[1:], picks[0], level)
+    summary.to_csv(output_file, index=False)
+    return summary
+
+
+def top_k_spatial(points_file, prediction_file, census_file, k, compute_weight, radius=40233.6, memory_mb=1024, results_file=None, output_file=None):
+    """top_k_locations for block-group scale data, without a neighbor graph.
+
+    points_file is a projected points .npz (ids, x, y, in metres) such as
+    reproject.cached_projection writes; neighborhoods are every point
+    within radius (25 miles by default) and are found on the fly (see
+    spatial_greedy.SpatialGreedy), so memory stays near memory_mb plus
+    a few arrays per point. Writes output_file and streams its picks to
+    results_file (by default files of its own) like top_k_locations, but
+    an existing results_file is written over, not resumed.
+    """
+    run = run_record('top_k_spatial', compute_weight, k, {'points': points_file, 'prediction': prediction_file, 'census': census_file}, radius=radius)
+    weights = read_weights(prediction_file, census_file, compute_weight)
+    with profiling.span('spatial_index', 'Building spatial index and gains'):
+        geo_ids, xy = spatial_greedy.read_points(points_file)
+        network = spatial_greedy.SpatialGreedy(geo_ids, xy, [weights.get(geo_id, 0.0) for geo_id in geo_ids], radius, memory_mb)
+    results_file, output_file = run_files(run, results_file, output_file)
+    lines = []
+    with profiling.span('greedy', 'Greedy'), pick_log.PickWriter(results_file, run, resume=False) as writer:
+        for i in range(k):
+            with profiling.span('pick'):
+                top, value = network.take()
+            lines.append(top + ": " + str(value))
+            writer.add(top, value, network.neighborhood(network.get_key(top)))
+    with open(output_file, "w+") as f:
+        f.write("\n".join(lines))
 
 
 if(__name__=='__main__'):
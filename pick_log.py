@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+import os
+import time
+
+# One record per greedy pick: the gain it added, the running total, how
+# many distinct tracts the picks so far cover and the heap entries
+# re-evaluated before it ([geoID, value, tiebreak], see
+# Network.sort_single), which a resumed run restores the heap from
+FIELDS = ['geoID', 'gain', 'cumulative_gain', 'covered_tracts', 'reevaluated']
+
+# Where runs given no results file write one (see run_filename)
+RUNS_DIR = 'runs'
+
+def file_format(filename):
+    return 'jsonl' if filename.endswith(('.jsonl', '.json')) else 'csv'
+
+def number(text):
+    # Keeps ints ints, so a resumed run prints gains as the original did
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def run_filename(run):
+    # A results file in RUNS_DIR no other run writes to: what it runs, k,
+    # the start time and the process id
+    os.makedirs(RUNS_DIR, exist_ok=True)
+    return os.path.join(RUNS_DIR, '{}_{}_k{}_{}_{}.csv'.format(run['method'], run['metric'].replace('compute_', ''), run['k'], time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+
+def read_picks(filename):
+    """The run record of filename, its picks (oldest first) and the byte length they span.
+
+    The run record is the first line (after '# ' in a CSV file, under
+    'run' in a JSON-lines one); it is None if the file has another
+    first line. A line cut short by a crash is not a pick; the length
+    stops before it.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    lines = data.split(b'\n')[:-1]
+    fmt = file_format(filename)
+    # The run record, and a CSV file's header, come before the picks
+    head = 2 if fmt == 'csv' else 1
+    if len(lines) < head:
+        return None, [], 0
+    if fmt == 'csv':
+        run = json.loads(lines[0][2:]) if lines[0].startswith(b'# ') else None
+    else:
+        run = json.loads(lines[0]).get('run')
+    if run is None:
+        return None, [], len(lines[0]) + 1
+    length = sum(len(line) + 1 for line in lines[:head])
+    picks = []
+    for line in lines[head:]:
+        if fmt == 'csv':
+            geo_id, gain, cumulative, covered, reevaluated = next(csv.reader(io.StringIO(line.decode())))
+            pick = {'geoID': geo_id, 'gain': number(gain), 'cumulative_gain': number(cumulative), 'covered_tracts': int(covered),
+                    'reevaluated': json.loads(reevaluated)}
+        else:
+            pick = json.loads(line)
+        picks.append(pick)
+        length += len(line) + 1
+    return run, picks, length
+
+class PickWriter:
+    """Streams greedy picks to a CSV or JSON-lines file as they are made.
+
+    Every pick is flushed when it is added, so a run that dies keeps
+    what it had picked. run (a JSON-able dict; see optimizer.run_record)
+    says what the picks depend on and heads the file. With resume, the
+    picks already in an existing file are kept (in `picks`) and new ones
+    appended after them; the caller replays them on the network (see
+    optimizer.replay) instead of recomputing them. A file headed by
+    another run is not resumed but raises ValueError.
+    """
+    def __init__(self, filename, run, resume=True):
+        self.filename = filename
+        self.fmt = file_format(filename)
+        self.picks = []
+        length = 0
+        if resume and os.path.isfile(filename):
+            recorded, self.picks, length = read_picks(filename)
+            if length and recorded != run:
+                raise ValueError('{} holds picks of another run ({}), not of {}'.format(filename, json.dumps(recorded), json.dumps(run)))
+        self.cumulative = self.picks[-1]['cumulative_gain'] if self.picks else 0
+        self.covered = set()
+        self.file = open(filename, 'r+' if length else 'w', newline='')
+        self.file.seek(length)
+        self.file.truncate()
+        if self.fmt == 'csv':
+            self.writer = csv.writer(self.file, lineterminator='\n')
+        if not length:
+            if self.fmt == 'csv':
+                self.file.write('# ' + json.dumps(run) + '\n')
+                self.writer.writerow(FIELDS)
+            else:
+                self.file.write(json.dumps({'run': run}) + '\n')
+            self.file.flush()
+
+    def add(self, geo_id, gain, covered_keys, reevaluated=()):
+        """Records a pick.
+
+        covered_keys are the tracts it covers (Network.neighborhood) and
+        reevaluated the [geoID, value, tiebreak] of the heap entries
+        re-evaluated before it was taken.
+        """
+        self.cumulative += gain
+        self.covered.update(covered_keys)
+        row = [geo_id, gain, self.cumulative, len(self.covered), list(reevaluated)]
+        if self.fmt == 'csv':
+            self.writer.writerow(row[:-1] + [json.dumps(row[-1])])
+        else:
+            self.file.write(json.dumps(dict(zip(FIELDS, row))) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,94 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from joblib import load
+import census_ingest
+from graph_cache import file_hash
+import profiling
+
+# Columns the regression notebook trains on; the label columns are not needed
+FEATURES = census_ingest.TRAIN_FEATURES
+
+def desert_features(census_file):
+    """The notebook's X_desert_intervention: desert tracts as if they had a college nearby."""
+    df = census_ingest.read_cached(census_file, FEATURES)
+    deserts = df[df['Education Desert'] == 1].reset_index(drop=True)
+    deserts['Education Desert'] = 0
+    return deserts
+
+def row_hashes(X):
+    # One 64-bit hash of every tract's feature values. The census cache
+    # downcasts columns when that is lossless, so hash them as float64
+    # to keep a tract's hash independent of its neighbors' values
+    return pd.util.hash_pandas_object(X.astype(np.float64), index=False).values
+
+def load_cache(cache_path, model_hash):
+    # geoID -> (feature hash, raw prediction) from a run with the same model
+    if not os.path.isfile(cache_path):
+        return {}
+    with np.load(cache_path) as cache:
+        if str(cache['model_hash']) != model_hash:
+            return {}
+        return {geo_id: (row_hash, pred) for geo_id, row_hash, pred in zip(cache['geo_ids'].tolist(), cache['row_hashes'], cache['preds'])}
+
+def set_n_jobs(model, n_jobs):
+    # Parallel trees/boosters for the estimators that support it
+    estimator = model[-1] if hasattr(model, 'steps') else model
+    if 'n_jobs' in estimator.get_params():
+        estimator.set_params(n_jobs=n_jobs)
+
+def predict(census_file, model_file, output_file, cache_path=None, chunksize=20000, n_jobs=-1, clip=True):
+    """Writes pred_pct_bachelors for every education desert tract, predicting only what changed.
+
+    The serialized model is loaded once and predictions are made
+    chunksize rows at a time. Raw predictions are cached in cache_path
+    (.npz) keyed by the model file's hash and a hash of each tract's
+    features, so after a partial census update only tracts whose
+    features changed (or that are new deserts) are re-predicted. The
+    output CSV is the one optimizer.py reads, clipped to [0, 1] like the
+    notebook's.
+    """
+    cache_path = cache_path or output_file + '.cache.npz'
+    with profiling.span('predict_features', 'Reading features'):
+        deserts = desert_features(census_file)
+        geo_ids = deserts['geoID'].astype(str).tolist()
+        X = deserts.drop(['geoID'], axis=1)
+        hashes = row_hashes(X)
+        model_hash = file_hash(model_file)
+        cached = load_cache(cache_path, model_hash)
+
+    preds = np.empty(len(geo_ids))
+    stale = []
+    for i, (geo_id, row_hash) in enumerate(zip(geo_ids, hashes)):
+        hit = cached.get(geo_id)
+        if hit is not None and hit[0] == row_hash:
+            preds[i] = hit[1]
+        else:
+            stale.append(i)
+    stale = np.array(stale, dtype=np.int64)
+    print('Predicting ' + str(len(stale)) + ' of ' + str(len(geo_ids)) + ' tracts')
+
+    if len(stale) > 0:
+        with profiling.span('predict', 'Predicting'):
+            model = load(model_file)
+            set_n_jobs(model, n_jobs)
+            for chunk in range(0, len(stale), chunksize):
+                rows = stale[chunk:chunk+chunksize]
+                preds[rows] = model.predict(X.iloc[rows])
+        np.savez(cache_path, model_hash=np.array(model_hash), geo_ids=np.array(geo_ids, dtype=str), row_hashes=hashes, preds=preds)
+
+    out = np.clip(preds, 0, 1) if clip else preds
+    pd.DataFrame({'geoID': geo_ids, 'pred_pct_bachelors': out}).to_csv(output_file, index=False)
+    return out
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Predict pct. bachelors and up for education desert tracts.')
+    parser.add_argument('--census', default='../data/census_tract_feats.csv')
+    parser.add_argument('--model', default='../models/RandomForest_balanced.joblib')
+    parser.add_argument('--output', default='../data/RandomForest_pct_bachelors_predictions.csv')
+    parser.add_argument('--cache', default=None)
+    parser.add_argument('--chunksize', type=int, default=20000)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    args = parser.parse_args()
+    predict(args.census, args.model, args.output, args.cache, args.chunksize, args.n_jobs)
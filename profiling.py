@@ -0,0 +1,95 @@
+import json
+import sys
+import time
+
+# The Recorder collecting spans and counters, or None when profiling is off
+active = None
+
+class Recorder:
+    def __init__(self):
+        self.started = time.time()
+        # name -> [count, total, min, max] seconds
+        self.spans = {}
+        self.counters = {}
+
+    def add_span(self, name, seconds):
+        stats = self.spans.get(name)
+        if stats is None:
+            self.spans[name] = [1, seconds, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = min(stats[2], seconds)
+            stats[3] = max(stats[3], seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        return {
+            'started': self.started,
+            'argv': sys.argv,
+            'spans': {name: {'count': count, 'total': total, 'mean': total / count, 'min': low, 'max': high}
+                      for name, (count, total, low, high) in self.spans.items()},
+            'counters': dict(self.counters),
+        }
+
+class Span:
+    __slots__ = ['name', 'label', 'start']
+
+    def __init__(self, name, label):
+        self.name = name
+        self.label = label
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        if active is not None:
+            active.add_span(self.name, seconds)
+        if self.label is not None:
+            print(self.label + ' took ' + str(seconds) + ' seconds')
+        return False
+
+class NullSpan:
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+def span(name, label=None):
+    """Times a with-block under name.
+
+    With a label, "<label> took N seconds" is printed as well, whether or
+    not profiling is on. Unlabelled spans (per-pick timings and the like)
+    cost nothing when profiling is off.
+    """
+    if active is None and label is None:
+        return NULL_SPAN
+    return Span(name, label)
+
+def count(name, n=1):
+    if active is not None:
+        active.count(name, n)
+
+def enable():
+    global active
+    active = Recorder()
+    return active
+
+def disable():
+    """Turns profiling off, returning what was recorded (or None)."""
+    global active
+    recorder, active = active, None
+    return recorder
+
+def write(recorder, filename):
+    with open(filename, 'w') as f:
+        json.dump(recorder.report(), f, indent=2)
@@ -0,0 +1,38 @@
+import hashlib
+import os
+import numpy as np
+from pyproj import Transformer
+from graph_cache import file_hash
+
+SOURCE_CRS = 'EPSG:4269'
+TARGET_CRS = 'EPSG:2163'
+
+def project(lon, lat, source_crs=SOURCE_CRS, target_crs=TARGET_CRS):
+    """Reprojects whole coordinate arrays with a single transformer call."""
+    transformer = Transformer.from_crs(source_crs, target_crs, always_xy=True)
+    x, y = transformer.transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+    return np.asarray(x), np.asarray(y)
+
+def inputs_hash(input_files, target_crs):
+    sha = hashlib.sha256(target_crs.encode())
+    for filename in input_files:
+        sha.update(file_hash(filename).encode())
+    return sha.hexdigest()
+
+def cached_projection(input_files, cache_path, read_points, target_crs=TARGET_CRS):
+    """Projected (ids, x, y) arrays for the points read from input_files.
+
+    read_points() returns (ids, lon, lat) arrays in SOURCE_CRS; it is only
+    called, and the projection only redone, when the hash of the input
+    files differs from the one stored in cache_path (.npz).
+    """
+    key = inputs_hash(input_files, target_crs)
+    if os.path.isfile(cache_path):
+        with np.load(cache_path) as cache:
+            if str(cache['hash']) == key:
+                return cache['ids'], cache['x'], cache['y']
+    ids, lon, lat = read_points()
+    x, y = project(lon, lat, target_crs=target_crs)
+    ids = np.asarray(ids).astype(str)
+    np.savez(cache_path, hash=np.array(key), ids=ids, x=x, y=y)
+    return ids, x, y
@@ -0,0 +1,80 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Rough bytes per (point, neighbor) pair while a chunk of radius
+# queries is in flight: the Python int in cKDTree's result list, the
+# concatenated index array and the repeated amounts
+PAIR_BYTES = 64
+
+class SpatialGreedy:
+    """Greedy site selection straight from point coordinates.
+
+    For block-group scale data, where neighbor lists within the radius
+    run into the thousands and the tracts_in_buffer graph no longer fits,
+    neighborhoods are found with a KD-tree as needed instead of being
+    stored. A site's neighborhood is every point within radius of it
+    (plain distance, so it is symmetric; the buffer polygon the
+    preprocessing uses differs only in a band 0.1% of the radius wide).
+
+    Every site's gain (the sum of the values in its neighborhood) is
+    kept up to date incrementally: taking a site zeroes the values it
+    covers and subtracts each of them from the gains of the sites within
+    radius of it. Queries run in chunks sized so that no more than
+    about memory_mb is spent on neighbor lists at once.
+    """
+    def __init__(self, geo_ids, xy, values, radius, memory_mb=1024):
+        self.geo_ids = list(geo_ids)
+        self.index = {geo_id: key for key, geo_id in enumerate(self.geo_ids)}
+        self.xy = np.asarray(xy, dtype=float)
+        self.values = np.array(values, dtype=float)
+        self.radius = radius
+        self.tree = cKDTree(self.xy)
+        n = len(self.xy)
+        sample = self.xy[np.linspace(0, n - 1, min(n, 1000)).astype(np.int64)]
+        degree = max(1.0, float(self.tree.query_ball_point(sample, radius, return_length=True).max()))
+        self.chunk = max(1, int(memory_mb * 2**20 / (PAIR_BYTES * degree)))
+        sources = np.flatnonzero(self.values)
+        self.gains = self.spread(sources, self.values[sources])
+
+    def ball(self, key):
+        return np.array(self.tree.query_ball_point(self.xy[key], self.radius), dtype=np.int64)
+
+    def get_key(self, geo_id):
+        return self.index[geo_id]
+
+    def neighborhood(self, key):
+        # Keys of the points a site at key covers, as Network.neighborhood
+        return self.ball(key).tolist()
+
+    def spread(self, sources, amounts):
+        # Each amount added to the gain of every site within radius of
+        # its source, one chunk of sources at a time
+        gains = np.zeros(len(self.xy))
+        for start in range(0, len(sources), self.chunk):
+            found = self.tree.query_ball_point(self.xy[sources[start:start+self.chunk]], self.radius, workers=-1)
+            lengths = np.fromiter(map(len, found), dtype=np.int64, count=len(found))
+            gains += np.bincount(np.concatenate(found).astype(np.int64), np.repeat(amounts[start:start+self.chunk], lengths), minlength=len(gains))
+        return gains
+
+    def take(self):
+        """Takes the best site, returning its geoID and the value it added."""
+        while True:
+            key = int(np.argmax(self.gains))
+            ball = np.sort(self.ball(key))
+            value = float(self.values[ball].sum())
+            # Incremental updates drift by rounding; settle on a site
+            # whose exact gain agrees with its running one
+            if self.gains[key] - value <= 1e-9 * max(1.0, abs(value)):
+                break
+            self.gains[key] = value
+        covered = ball[self.values[ball] != 0]
+        amounts = self.values[covered]
+        self.values[covered] = 0.0
+        self.gains -= self.spread(covered, amounts)
+        self.gains[key] = 0.0
+        return self.geo_ids[key], value
+
+def read_points(points_file):
+    """(ids, xy) from a projected points .npz as reproject.cached_projection writes."""
+    with np.load(points_file) as points:
+        return points['ids'].tolist(), np.column_stack([points['x'], points['y']])
@@ -0,0 +1,68 @@
+import math
+import numpy as np
+from multiprocessing import Pool
+from scipy.spatial import cKDTree
+from shapely.geometry import Point
+
+# shapely's buffer() approximates the circle with a 64-gon whose vertices
+# lie on it. Points closer than the polygon's inradius are certainly
+# inside it, points farther than the radius certainly outside; only the
+# thin band in between needs the polygon itself.
+QUAD_SEGS = 16
+INRADIUS = math.cos(math.pi / (4 * QUAD_SEGS)) * (1 - 1e-9)
+
+# Set up in each worker by init_worker
+tree = None
+points = None
+
+def init_worker(xy):
+    global tree, points
+    points = xy
+    tree = cKDTree(xy)
+
+def buffer_members(center, candidates, candidate_points, radius):
+    # Which candidates lie inside center's buffer polygon
+    dist = np.hypot(*(candidate_points - center).T)
+    inside = dist < radius * INRADIUS
+    edge = np.flatnonzero(~inside & (dist <= radius))
+    if len(edge) > 0:
+        circle = Point(center).buffer(radius, QUAD_SEGS)
+        inside[edge] = [circle.contains(Point(candidate_points[j])) for j in edge]
+    return candidates[inside]
+
+def within_buffer(shard, radius):
+    """Neighbors within radius (as shapely's buffer sees it) for each point in shard."""
+    neighbors = []
+    for i, candidates in zip(shard, tree.query_ball_point(points[shard], radius)):
+        candidates = np.sort(np.array(candidates, dtype=np.int64))
+        candidates = candidates[candidates != i]
+        neighbors.append(buffer_members(points[i], candidates, points[candidates], radius))
+    return shard, neighbors
+
+def points_in_buffer(center_xy, point_xy, radius):
+    """For each center, the rows of point_xy within its buffer, in row order."""
+    center_xy = np.asarray(center_xy, dtype=float)
+    point_xy = np.asarray(point_xy, dtype=float)
+    found = []
+    for center, candidates in zip(center_xy, cKDTree(point_xy).query_ball_point(center_xy, radius)):
+        candidates = np.sort(np.array(candidates, dtype=np.int64))
+        found.append(buffer_members(center, candidates, point_xy[candidates], radius))
+    return found
+
+def tracts_in_buffer(geoids, xy, radius, processes=None):
+    """Maps each geoid to the geoids whose points lie within radius of its own.
+
+    xy holds projected (metre) coordinates, one row per geoid. The work is
+    sharded by state (the first two digits of the geoid) over a process
+    pool; each worker queries one KD-tree over all points, so neighbors
+    across state lines are found. Neighbors are listed in input order.
+    """
+    geoids = np.asarray(geoids)
+    states = np.array([geoid[:2] for geoid in geoids])
+    shards = [(np.flatnonzero(states == state), radius) for state in np.unique(states)]
+    neighbors = [None] * len(geoids)
+    with Pool(processes, init_worker, (np.asarray(xy, dtype=float),)) as pool:
+        for shard, shard_neighbors in pool.starmap(within_buffer, shards):
+            for i, found in zip(shard, shard_neighbors):
+                neighbors[i] = geoids[found[geoids[found] != geoids[i]]].tolist()
+    return {geoid: found for geoid, found in zip(geoids.tolist(), neighbors)}
@@ -0,0 +1,48 @@
+import fiona
+import numpy as np
+from multiprocessing import Pool
+from shapely.geometry import MultiPoint
+
+def outer_ring(coordinates):
+    # Some of the geometries are polygons and some multipolygons; either
+    # way the centroid comes from the first ring listed
+    ring = coordinates[0]
+    if any(len(lat_long) != 2 for lat_long in ring):
+        ring = ring[0]
+    return ring
+
+def read_state(state_dir, keep=None):
+    """Reads one state's census tract shapefile.
+
+    Returns (geoids, lon, lat, polygons): arrays with the representative
+    point of each tract (in the shapefile's EPSG:4269; see reproject.py),
+    plus the raw geometry of just the tracts whose geoid is in keep
+    (nothing by default).
+    """
+    geoids = []
+    points = []
+    polygons = {}
+    with fiona.open(state_dir, 'r') as state_shapes:
+        for census_tract in state_shapes:
+            geoid = census_tract['properties']['GEOID']
+            geoids.append(geoid)
+            # A represenative point, not centroid,
+            # that is guarnateed to be with the geometry
+            point = MultiPoint(outer_ring(census_tract['geometry']['coordinates'])).representative_point()
+            points.append((point.x, point.y))
+            if keep is not None and geoid in keep:
+                polygons[geoid] = census_tract['geometry']
+    lon, lat = np.array(points, dtype=float).reshape(-1, 2).T
+    return np.array(geoids, dtype=str), lon, lat, polygons
+
+def read_states(state_dirs, keep=None, processes=None):
+    """read_state over every state directory in a process pool, concatenated in order."""
+    with Pool(processes) as pool:
+        states = pool.starmap(read_state, [(state_dir, keep) for state_dir in state_dirs])
+    geoids = np.concatenate([state[0] for state in states])
+    lon = np.concatenate([state[1] for state in states])
+    lat = np.concatenate([state[2] for state in states])
+    polygons = {}
+    for state in states:
+        polygons.update(state[3])
+    return geoids, lon, lat, polygons
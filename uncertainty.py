@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+def tree_samples(model, X):
+    """One pct_pred draw per tree of a fitted random forest (or a pipeline ending in one).
+
+    Returns a (trees, rows) matrix, clipped to [0, 1] as the regression
+    notebook clips its predictions.
+    """
+    if hasattr(model, 'steps'):
+        X = model[:-1].transform(X)
+        model = model[-1]
+    X = np.asarray(X)
+    return np.clip(np.stack([tree.predict(X) for tree in model.estimators_]), 0, 1)
+
+def residual_samples(pct_pred, residuals, n_samples, seed=0):
+    """n_samples draws of pct_pred plus residuals resampled with replacement.
+
+    residuals are the model's held-out errors (actual minus predicted);
+    returns a (n_samples, rows) matrix clipped to [0, 1].
+    """
+    rng = np.random.default_rng(seed)
+    pct_pred = np.asarray(pct_pred, dtype=float)
+    noise = rng.choice(np.asarray(residuals, dtype=float), size=(n_samples, len(pct_pred)))
+    return np.clip(pct_pred + noise, 0, 1)
+
+def summarize(sample_picks, baseline_picks=None, level=0.9):
+    """Per-tract selection frequency and rank interval over the samples' top-k lists.
+
+    Ranks count from 1. Only tracts picked in some sample are listed,
+    most often picked first; rank_low and rank_high bound the central
+    `level` share of the ranks the tract got when it was picked.
+    """
+    ranks = {}
+    for picks in sample_picks:
+        for rank, geo_id in enumerate(picks, 1):
+            ranks.setdefault(geo_id, []).append(rank)
+    baseline = {geo_id: rank for rank, geo_id in enumerate(baseline_picks or [], 1)}
+    tail = (1 - level) / 2
+    rows = []
+    for geo_id, tract_ranks in ranks.items():
+        rows.append({
+            'geoID': geo_id,
+            'frequency': len(tract_ranks) / len(sample_picks),
+            'rank_mean': np.mean(tract_ranks),
+            'rank_low': np.quantile(tract_ranks, tail),
+            'rank_high': np.quantile(tract_ranks, 1 - tail),
+            'baseline_rank': baseline.get(geo_id, np.nan),
+        })
+    df = pd.DataFrame(rows, columns=['geoID', 'frequency', 'rank_mean', 'rank_low', 'rank_high', 'baseline_rank'])
+    return df.sort_values(['frequency', 'rank_mean'], ascending=[False, True]).reset_index(drop=True)
@@ -0,0 +1,86 @@
+import numpy as np
+
+class SiteSession:
+    """Interactive "what if we build at X" queries on top of a CSRNetwork.
+
+    Keeps every tract's neighborhood sum (the value top_k_locations would
+    give it next) up to date incrementally: taking a site only touches the
+    rows that contain one of the tracts it covers, and undo() reverses
+    exactly those updates. The session takes ownership of the network's
+    values array.
+
+        session = SiteSession(read_network(..., compact=True), exclude=['06037...'])
+        session.take('37133000103')
+        session.top(5)
+        session.undo()
+    """
+    def __init__(self, network, include=(), exclude=()):
+        self.network = network
+        n = len(network.geo_ids)
+        # Transpose of the adjacency: which rows each tract appears in
+        order = np.argsort(network.indices, kind='stable')
+        self.rows_of = np.repeat(np.arange(n, dtype=np.int32), np.diff(network.indptr))[order]
+        self.rows_ptr = np.concatenate([[0], np.cumsum(np.bincount(network.indices, minlength=n))])
+        self.totals = np.array(network.initial_values(), dtype=float)
+        self.excluded = np.zeros(n, dtype=bool)
+        self.history = []
+        for geo_id in exclude:
+            self.exclude(geo_id)
+        for geo_id in include:
+            self.take(geo_id)
+
+    def row(self, key):
+        return self.network.indices[self.network.indptr[key]:self.network.indptr[key+1]]
+
+    def spread(self, tracts, vals):
+        # Sum of vals over every row containing each tract, as a dense array
+        starts = self.rows_ptr[tracts]
+        lengths = self.rows_ptr[tracts + 1] - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.bincount(self.rows_of[positions], np.repeat(vals, lengths), minlength=len(self.totals))
+
+    def gain(self, geo_id):
+        return self.network.get_total_value(self.network.index[geo_id])
+
+    def take(self, geo_id):
+        """Builds at geo_id, returning the value it added."""
+        key = self.network.index[geo_id]
+        gain = self.gain(geo_id)
+        values = self.network.values
+        row = np.unique(self.row(key))
+        covered = row[values[row] != 0]
+        self.history.append((geo_id, covered, values[covered].copy(), row, self.network.is_int[row].copy()))
+        self.totals -= self.spread(covered, values[covered])
+        values[covered] = 0.0
+        # As CSRNetwork.clear: cleared values are float zeros, so gains
+        # print as Network's do
+        self.network.is_int[row] = False
+        return gain
+
+    def undo(self):
+        """Reverts the most recent take, returning its geoID."""
+        geo_id, covered, old_values, row, old_is_int = self.history.pop()
+        self.network.values[covered] = old_values
+        self.network.is_int[row] = old_is_int
+        self.totals += self.spread(covered, old_values)
+        return geo_id
+
+    def taken(self):
+        return [history[0] for history in self.history]
+
+    def exclude(self, geo_id):
+        self.excluded[self.network.index[geo_id]] = True
+
+    def allow(self, geo_id):
+        self.excluded[self.network.index[geo_id]] = False
+
+    def top(self, n=10):
+        """Returns the n best next sites as (geoID, value) pairs."""
+        totals = np.where(self.excluded, -np.inf, self.totals)
+        n = min(n, int(np.count_nonzero(~self.excluded)))
+        if n <= 0:
+            return []
+        best = np.argpartition(-totals, n - 1)[:n]
+        # Exact sums for the handful returned, free of incremental drift
+        best = [(self.network.get_geo_id(key), self.network.get_total_value(key)) for key in best]
+        return sorted(best, key=lambda pair: -pair[1])